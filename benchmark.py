@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import subprocess
+
+from engine import Board, Player
+
+# fixed test positions as the columns played from an empty board, red moves first. minimax is searched to the depth of
+# the geometry from every position, none of the positions is decided within that depth
+POSITIONS = {
+    (7, 6, 4): {'depth': 9,
+                'positions': {'opening': '33',
+                              'middlegame': '1466602036335361',
+                              'endgame': '34221160243402445053153531110'}},
+    (10, 10, 4): {'depth': 6,
+                  'positions': {'opening': '55',
+                                'middlegame': '3369802709826363042239865300488180079855',
+                                'endgame': '203771709796444547354789580228639326847375401414597631821704'}},
+    (6, 6, 4): {'depth': 9,
+                'positions': {'opening': '33',
+                              'middlegame': '00021552241505',
+                              'endgame': '4142052135541023514335122'}},
+}
+# programs timed from a fresh interpreter, like the short-lived worker processes that search a position and exit
+STARTUP_PROGRAMS = {
+    'engine': ("from engine import Board, Player\n"
+               "board = Board(7, 6, 4)\n"
+               "board.iterative_deepening(Player('Red', 1, True), Player('Yellow', 2, True), max_depth=1)"),
+    'main': "import main\nmain.Game(main.Board(7, 6, 4), main.Player('Red', 1, False), main.Player('Yellow', 2, True))",
+}
+# every startup program prints how long it took from its first import until it was done and what it loaded
+STARTUP_TEMPLATE = ("import sys, time\nstart = time.perf_counter()\n{program}\n"
+                    "print(time.perf_counter() - start, 'numpy' in sys.modules, 'pygame' in sys.modules)")
+STARTUP_SLACK = 0.005  # startup times are a few milliseconds, differences below 5 ms are noise
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+
+def setup_position(geometry, moves):
+    # returns the board after the moves and the players to move and not to move
+    board = Board(*geometry)
+    players = [Player('Red', 1, True), Player('Yellow', 2, True)]
+    for ply, column in enumerate(moves):
+        board.drop_piece(board.get_next_open_row(int(column)), int(column), players[ply % 2])
+    return board, players[len(moves) % 2], players[1 - len(moves) % 2]
+
+
+def time_operation(operation, iterations, repeats):
+    # best of the repeats, the fastest run is the one least disturbed by everything else running on the machine
+    best = math.inf
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        operation(iterations)
+        best = min(best, time.perf_counter() - start)
+    return iterations / best
+
+
+def benchmark_position(geometry, depth, moves, iterations, repeats):
+    board, current_player, opposing_player = setup_position(geometry, moves)
+    valid_locations = board.get_valid_locations()
+    last_column = int(moves[-1])
+    last_row = board.heights[last_column] - 1
+    last_player = opposing_player
+
+    def drop_piece(count):
+        # every drop is undone again so the position stays the same, the time includes undo_move
+        for i in range(count):
+            column = valid_locations[i % len(valid_locations)]
+            board.drop_piece(board.heights[column], column, current_player)
+            board.undo_move()
+
+    def is_winning_move(count):
+        for i in range(count):
+            board.is_winning_move(last_row, last_column, last_player)
+
+    def score_position(count):
+        for i in range(count):
+            board.score_position(last_column, last_row, current_player, opposing_player)
+
+    def get_valid_locations(count):
+        for i in range(count):
+            board.get_valid_locations()
+
+    results = {}
+    for name, operation in (('drop_piece', drop_piece), ('is_winning_move', is_winning_move),
+                            ('score_position', score_position), ('get_valid_locations', get_valid_locations)):
+        results[name] = {'ops_per_second': time_operation(operation, iterations, repeats)}
+
+    # every minimax run starts from an empty transposition table and empty move ordering tables so it searches the
+    # same nodes every time
+    best_time, nodes = math.inf, 0
+    for repeat in range(repeats):
+        board, current_player, opposing_player = setup_position(geometry, moves)
+        start = time.perf_counter()
+        board.minimax(depth, -math.inf, math.inf, True, 0, 0, current_player, opposing_player)
+        best_time = min(best_time, time.perf_counter() - start)
+        nodes = board.nodes_searched
+    results['minimax'] = {'depth': depth, 'nodes': nodes, 'seconds': best_time, 'nodes_per_second': nodes / best_time}
+    return results
+
+
+def benchmark_startup(repeats):
+    # the best of the repeats for the time until the program is done, and for the whole process including starting
+    # the interpreter
+    results = {}
+    for name, program in STARTUP_PROGRAMS.items():
+        best_seconds, best_process_seconds = math.inf, math.inf
+        for repeat in range(repeats):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', STARTUP_TEMPLATE.format(program=program)], cwd=ROOT,
+                                    capture_output=True, text=True, check=True).stdout.split()
+            best_process_seconds = min(best_process_seconds, time.perf_counter() - start)
+            best_seconds = min(best_seconds, float(output[0]))
+        results[name] = {'seconds': best_seconds, 'process_seconds': best_process_seconds,
+                         'loads_numpy': output[1] == 'True', 'loads_pygame': output[2] == 'True'}
+    return results
+
+
+def run_benchmarks(iterations=20000, repeats=3, geometries=None):
+    results = {}
+    for geometry, settings in POSITIONS.items():
+        if geometries is not None and geometry not in geometries:
+            continue
+        for stage, moves in settings['positions'].items():
+            name = f"{'x'.join(map(str, geometry))}/{stage}"
+            results[name] = benchmark_position(geometry, settings['depth'], moves, iterations, repeats)
+            print(f"\rbenchmarked {name:<20}", end='', file=sys.stderr)
+    print(file=sys.stderr)
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'results': results,
+            'startup': benchmark_startup(max(repeats, 5))}
+
+
+def rate(measurement):
+    return measurement.get('ops_per_second', measurement.get('nodes_per_second'))
+
+
+def format_results(report):
+    lines = [f"{'position':<20} {'operation':<20} {'ops/s or nodes/s':>16}"]
+    for name, operations in report['results'].items():
+        for operation, measurement in operations.items():
+            line = f"{name:<20} {operation:<20} {rate(measurement):>16,.0f}"
+            if operation == 'minimax':
+                line += f"  ({measurement['nodes']} nodes to depth {measurement['depth']})"
+            lines.append(line)
+    for name, measurement in report.get('startup', {}).items():
+        loaded = [module for module in ('numpy', 'pygame') if measurement['loads_' + module]]
+        lines.append(f"startup {name:<12} {measurement['seconds'] * 1000:6.1f} ms until usable, "
+                     f"{measurement['process_seconds'] * 1000:6.1f} ms for the whole process, "
+                     f"loads {', '.join(loaded) if loaded else 'neither numpy nor pygame'}")
+    return '\n'.join(lines)
+
+
+def compare(report, baseline, tolerance):
+    # returns a line for every measurement that is slower than the baseline by more than the tolerance, and for every
+    # search that now visits a different number of nodes, which means the search itself changed
+    regressions = []
+    for name, operations in report['results'].items():
+        for operation, measurement in operations.items():
+            baseline_measurement = baseline['results'].get(name, {}).get(operation)
+            if baseline_measurement is None:
+                continue
+            change = rate(measurement) / rate(baseline_measurement) - 1
+            if change < -tolerance:
+                regressions.append(f"{name} {operation}: {rate(measurement):,.0f}/s is {-change:.0%} slower than "
+                                   f"the baseline {rate(baseline_measurement):,.0f}/s")
+            if operation == 'minimax' and measurement['nodes'] != baseline_measurement['nodes']:
+                regressions.append(f"{name} minimax: searched {measurement['nodes']} nodes, the baseline searched "
+                                   f"{baseline_measurement['nodes']}")
+    for name, measurement in report.get('startup', {}).items():
+        baseline_measurement = baseline.get('startup', {}).get(name)
+        if baseline_measurement is None:
+            continue
+        if measurement['seconds'] > max(baseline_measurement['seconds'] * (1 + tolerance),
+                                        baseline_measurement['seconds'] + STARTUP_SLACK):
+            regressions.append(f"startup {name}: {measurement['seconds'] * 1000:.1f} ms is slower than the baseline "
+                               f"{baseline_measurement['seconds'] * 1000:.1f} ms")
+        for module in ('numpy', 'pygame'):
+            if measurement['loads_' + module] and not baseline_measurement['loads_' + module]:
+                regressions.append(f"startup {name}: now loads {module}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the board operations and the search on fixed positions.')
+    parser.add_argument('--iterations', type=int, default=20000, help='calls per timed board operation')
+    parser.add_argument('--repeats', type=int, default=3, help='runs of every measurement, the fastest counts')
+    parser.add_argument('--geometry', action='append',
+                        help='only benchmark this board, e.g. 7x6x4, can be repeated (default: all)')
+    parser.add_argument('--output', help='JSON file to write the results to, e.g. benchmarks/baseline.json')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='how much slower than the baseline a measurement may be (default 0.2 for 20%%)')
+    args = parser.parse_args()
+    geometries = None
+    if args.geometry:
+        geometries = [tuple(int(value) for value in text.lower().split('x')) for text in args.geometry]
+        unknown = [geometry for geometry in geometries if geometry not in POSITIONS]
+        if unknown:
+            parser.error(f"no test positions for {', '.join('x'.join(map(str, g)) for g in unknown)}")
+
+    report = run_benchmarks(args.iterations, args.repeats, geometries)
+    print(format_results(report))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    # writing a new baseline doesn't compare against the old one
+    writing_baseline = args.output is not None and os.path.abspath(args.output) == os.path.abspath(args.baseline)
+    if os.path.exists(args.baseline) and not writing_baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print('\nregressions against ' + args.baseline + ':\n' + '\n'.join(regressions))
+            return 1
+        print(f"\nno regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1311 @@
+import os
+import sys
+import random
+import math
+import time
+
+# numpy, cProfile and the process pools are imported by the code that uses them, so a program that only searches can
+# import the engine and create a Board in a few milliseconds
+
+# score of a won position, anything at least this large means the game is decided
+WINNING_SCORE = 1000000000000000
+
+
+class SearchTimeout(Exception):
+    # raised from inside the search when the time or node budget of a move has run out
+    pass
+
+
+class TranspositionTable:
+    # bound types of a stored value
+    EXACT = 0
+    LOWER_BOUND = 1
+    UPPER_BOUND = 2
+    # rough number of bytes one stored entry takes up, used to turn the memory cap into a number of slots
+    ENTRY_SIZE = 200
+
+    def __init__(self, max_megabytes=16):
+        self.max_megabytes = max_megabytes
+        self.num_of_buckets = max(1, max_megabytes * 1024 * 1024 // (2 * self.ENTRY_SIZE))
+        # every bucket has a depth-preferred slot that keeps the deepest search of a position and an always-replace
+        # slot that keeps the most recent one, entries are (key, depth, value, bound, move) tuples
+        self.depth_preferred = [None] * self.num_of_buckets
+        self.always_replace = [None] * self.num_of_buckets
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        index = key % self.num_of_buckets
+        entry = self.depth_preferred[index]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        entry = self.always_replace[index]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, value, bound, move):
+        index = key % self.num_of_buckets
+        entry = (key, depth, value, bound, move)
+        current = self.depth_preferred[index]
+        if current is None or current[0] == key or depth >= current[1]:
+            self.depth_preferred[index] = entry
+        else:
+            self.always_replace[index] = entry
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        self.depth_preferred = [None] * self.num_of_buckets
+        self.always_replace = [None] * self.num_of_buckets
+        self.hits = 0
+        self.misses = 0
+
+
+class SearchStats:
+    # what one search did, Board.minimax, Board.iterative_deepening and ParallelSearch.search leave one in search_stats
+    def __init__(self, num_of_columns=0):
+        self.nodes = 0
+        self.leaf_evaluations = 0
+        # how often a move caused a beta cutoff by its place in the move order, good ordering puts most of them at 0
+        self.cutoffs_by_move_index = [0] * num_of_columns
+        self.table_hits = 0
+        self.table_lookups = 0
+        self.depth = 0
+        self.elapsed_time = 0
+
+    def add(self, other):
+        # adds the counts of a search that ran next to this one, depth and elapsed time are left to the caller
+        self.nodes += other.nodes
+        self.leaf_evaluations += other.leaf_evaluations
+        for index, cutoffs in enumerate(other.cutoffs_by_move_index):
+            self.cutoffs_by_move_index[index] += cutoffs
+        self.table_hits += other.table_hits
+        self.table_lookups += other.table_lookups
+
+    def table_hit_rate(self):
+        return self.table_hits / self.table_lookups if self.table_lookups else 0.0
+
+    def nodes_per_second(self):
+        return self.nodes / self.elapsed_time if self.elapsed_time else 0.0
+
+    def as_dict(self):
+        return {'nodes': self.nodes, 'leaf_evaluations': self.leaf_evaluations,
+                'cutoffs_by_move_index': self.cutoffs_by_move_index, 'table_hit_rate': self.table_hit_rate(),
+                'depth': self.depth, 'elapsed_time': self.elapsed_time, 'nodes_per_second': self.nodes_per_second()}
+
+    def __str__(self):
+        return (f"depth {self.depth}, {self.nodes} nodes ({self.leaf_evaluations} leaf evaluations) in "
+                f"{self.elapsed_time:.3f}s, {self.nodes_per_second():.0f} nodes/s, table hit rate "
+                f"{self.table_hit_rate():.1%}, cutoffs by move index {self.cutoffs_by_move_index}")
+
+
+def profile_call(function, *args, limit=20, **kwargs):
+    # runs function under cProfile, prints the functions it spent the most time in to stderr and returns its result
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args, **kwargs)
+    pstats.Stats(profiler, stream=sys.stderr).sort_stats('tottime').print_stats(limit)
+    return result
+
+
+def evaluate_window(num_to_connect, window_current_piece_count, window_empty_count, window_opposing_piece_count):
+    score = 0
+    if window_current_piece_count == num_to_connect:
+        score += 100
+    elif window_current_piece_count == num_to_connect - 1 and window_empty_count == 1:
+        score += 5
+    elif window_current_piece_count == num_to_connect - 2 and window_empty_count == 2:
+        score += 2
+
+    if window_opposing_piece_count == num_to_connect - 1 and window_empty_count == 1:
+        score -= 4
+
+    return score
+
+
+class BoardGeometry:
+    # everything about a board size that never changes during a game: the hashing keys, every window (line of
+    # num_to_connect cells) with the windows through every cell, and the masks used to find winning cells. get_geometry
+    # builds it once per board size and every Board, Solver and search of that size shares it
+    def __init__(self, num_of_columns, num_of_rows, num_to_connect):
+        self.num_of_columns = num_of_columns
+        self.num_of_rows = num_of_rows
+        self.num_to_connect = num_to_connect
+        # bitboards: every column uses num_of_rows + 1 bits, the extra bit on top of each column stays empty so that
+        # shifted patterns can never wrap from the top of one column into the bottom of the next
+        self.column_height = num_of_rows + 1
+        self.num_of_bits = num_of_columns * self.column_height
+        # shift amounts for vertical, horizontal, / diagonal and \ diagonal lines
+        self.directions = (1, self.column_height, self.column_height + 1, self.column_height - 1)
+        self.column_masks = [((1 << num_of_rows) - 1) << (c * self.column_height) for c in range(num_of_columns)]
+        self.bottom_mask = sum(1 << (c * self.column_height) for c in range(num_of_columns))
+        self.board_mask = self.bottom_mask * ((1 << num_of_rows) - 1)
+        # for every direction and every place an empty cell can have in a line, how far away the other cells of the
+        # line are. A cell wins when all of them hold the player's pieces
+        self.line_offsets = [[(j - i) * shift for j in range(num_to_connect) if j != i]
+                             for shift in self.directions for i in range(num_to_connect)]
+        # zobrist hashing: one random key per piece and cell, the hash of a position is the xor of the keys of every
+        # piece on the board. The keys only depend on the board size so the same position always gets the same hash
+        key_generator = random.Random(num_of_columns * 100 + num_of_rows)
+        self.zobrist_keys = [[key_generator.getrandbits(64) for i in range(self.num_of_bits)] for piece in range(3)]
+        # the search stores values from the point of view of the player it is searching for
+        self.perspective_keys = [key_generator.getrandbits(64) for piece in range(3)]
+        self.center_order = sorted(range(num_of_columns), key=lambda c: abs(2 * c - (num_of_columns - 1)))
+        self.windows = []
+        self.cell_windows = [[] for i in range(self.num_of_bits)]  # the windows every cell is part of
+        for c in range(num_of_columns):
+            for r in range(num_of_rows):
+                for dc, dr in ((1, 0), (0, 1), (1, 1), (1, -1)):
+                    end_c, end_r = c + dc * (num_to_connect - 1), r + dr * (num_to_connect - 1)
+                    if 0 <= end_c < num_of_columns and 0 <= end_r < num_of_rows:
+                        window = [(c + dc * i) * self.column_height + r + dr * i for i in range(num_to_connect)]
+                        for index in window:
+                            self.cell_windows[index].append(len(self.windows))
+                        self.windows.append(window)
+        # score of a window for a player with current pieces in it against opposing pieces
+        self.window_scores = [[evaluate_window(num_to_connect, current, num_to_connect - current - opposing, opposing)
+                               if current + opposing <= num_to_connect else 0
+                               for opposing in range(num_to_connect + 1)] for current in range(num_to_connect + 1)]
+        # the same windows for boards stored as a flattened (num_of_rows, num_of_columns) grid like Board.board, as
+        # BatchEvaluator does: the grid index of every cell of every window
+        self.grid_windows = [[(index % self.column_height) * num_of_columns + index // self.column_height
+                              for index in window] for window in self.windows]
+        # the Monte Carlo playouts keep every row, column and diagonal of such a grid as a bitmask with one bit per cell
+        # instead. grid_cell_lines holds the line and the bit of every grid cell in all four directions
+        lines = {}
+        self.grid_cell_lines = []
+        for i in range(num_of_rows * num_of_columns):
+            r, c = divmod(i, num_of_columns)
+            self.grid_cell_lines.append([(lines.setdefault(line, len(lines)), bit)
+                                         for line, bit in ((('-', r), c), (('|', c), r), (('/', r - c), c),
+                                                           (('\\', r + c), c))])
+        self.num_of_grid_lines = len(lines)
+
+    def has_connected(self, bitboard):
+        # after k shift-and-mask steps a bit is only left where k + 1 pieces are in a row in that direction
+        for shift in self.directions:
+            line = bitboard
+            for i in range(self.num_to_connect - 1):
+                line &= line >> shift
+            if line:
+                return True
+        return False
+
+    def winning_cells(self, position, mask):
+        # empty cells that would complete a line for the player whose pieces are in position
+        cells = 0
+        for offsets in self.line_offsets:
+            line = -1
+            for offset in offsets:
+                line &= position >> offset if offset > 0 else position << -offset
+            cells |= line
+        return cells & (self.board_mask ^ mask)
+
+
+class ThreatAnalysis:
+    # the moves of a position that decide the game within the next few moves, found by Board.analyze_threats. Columns
+    # are listed centre first
+    def __init__(self, winning_moves, forced_blocks, losing_moves, safe_moves, double_threats):
+        self.winning_moves = winning_moves  # connect a line right away
+        self.forced_blocks = forced_blocks  # the opponent connects a line there next unless it is blocked
+        self.losing_moves = losing_moves  # right below a cell the opponent connects a line with
+        self.safe_moves = safe_moves  # the moves that don't let the opponent win next, empty when every move does
+        self.double_threats = double_threats  # leave two winning cells and the opponent can only block one
+
+    def is_won(self):
+        return bool(self.winning_moves or self.double_threats)
+
+    def is_lost(self):
+        return not self.winning_moves and not self.safe_moves
+
+    def forced_move(self):
+        # the only move that doesn't lose right away, None when there are more or none, or the game is won
+        if not self.winning_moves and len(self.safe_moves) == 1:
+            return self.safe_moves[0]
+        return None
+
+
+geometries = {}  # the BoardGeometry of every board size used so far
+
+
+def get_geometry(num_of_columns, num_of_rows, num_to_connect):
+    key = (num_of_columns, num_of_rows, num_to_connect)
+    if key not in geometries:
+        geometries[key] = BoardGeometry(num_of_columns, num_of_rows, num_to_connect)
+    return geometries[key]
+
+
+class Board:
+    def __init__(self, num_of_columns, num_of_rows, num_to_connect, transposition_table=None):
+        self.num_of_columns = num_of_columns
+        self.num_of_rows = num_of_rows
+        self.num_to_connect = num_to_connect
+        # the keys, windows and masks of the board size are built once and shared by every board of that size
+        geometry = get_geometry(num_of_columns, num_of_rows, num_to_connect)
+        self.geometry = geometry
+        self.column_height = geometry.column_height
+        self.bitboards = [0, 0, 0]  # one mask per piece (1 and 2), index 0 is unused
+        self.heights = [0] * num_of_columns  # next open row of every column
+        self.move_history = []  # columns in the order pieces were dropped, used as the undo stack
+        self.directions = geometry.directions
+        self.has_connected = geometry.has_connected  # whether a bitboard has num_to_connect pieces in a row
+        self.zobrist_keys = geometry.zobrist_keys
+        self.hash = 0
+        # hash of the position mirrored left to right, a position and its mirror image are worth the same so the
+        # transposition table and opening book use the smaller of the two hashes
+        self.mirror_hash = 0
+        self.perspective_keys = geometry.perspective_keys
+        if transposition_table is None:
+            transposition_table = TranspositionTable()
+        self.transposition_table = transposition_table
+        # search state used by iterative_deepening, the budgets are None when minimax is called directly
+        self.nodes_searched = 0
+        self.deadline = None
+        self.node_budget = None
+        self.search_root_length = 0
+        self.principal_variation = []
+        self.following_principal_variation = False
+        self.search_player = None
+        self.search_opponent = None
+        self.root_moves = None  # when set, only these columns are searched at the root
+        self.iteration_results = []  # (depth, column, score) of every finished iteration of the last search
+        self.stop_event = None  # a threading.Event that stops the search when it is set
+        self.search_stats = SearchStats(num_of_columns)
+        # move ordering: centre columns first, refined by killer moves per ply and a history score per piece and cell
+        self.center_order = geometry.center_order
+        self.killer_moves = [[None, None] for ply in range(num_of_columns * num_of_rows + 1)]
+        self.history_scores = [[0] * geometry.num_of_bits for piece in range(3)]
+        # incremental evaluation: every window of num_to_connect cells in a line keeps a count of each player's pieces
+        # and the score of the whole position for each player is updated when a piece is dropped or undone
+        self.windows = geometry.windows
+        self.cell_windows = geometry.cell_windows
+        self.window_counts = [[0] * len(self.windows) for piece in range(3)]
+        self.window_scores = geometry.window_scores
+        self.position_scores = [0, 0, 0]
+
+    @property
+    def board(self):
+        # the pieces as a (num_of_rows, num_of_columns) int8 array, 0 for empty cells and row 0 at the bottom. It is
+        # built from the bitboards when it is asked for, so the search never touches numpy and programs that only
+        # search never import it
+        import numpy as np
+        grid = np.zeros((self.num_of_rows, self.num_of_columns), dtype=np.int8)
+        for piece in (1, 2):
+            bitboard = self.bitboards[piece]
+            while bitboard:
+                index = (bitboard & -bitboard).bit_length() - 1
+                grid[index % self.column_height][index // self.column_height] = piece
+                bitboard &= bitboard - 1
+        return grid
+
+    def piece_at(self, row, column):
+        # the piece in a cell, 0 when it is empty
+        bit = 1 << (column * self.column_height + row)
+        if self.bitboards[1] & bit:
+            return 1
+        return 2 if self.bitboards[2] & bit else 0
+
+    def drop_piece(self, row, column, current_player):
+        index = column * self.column_height + row
+        mirror_index = (self.num_of_columns - 1 - column) * self.column_height + row
+        self.bitboards[current_player.piece] |= 1 << index
+        self.hash ^= self.zobrist_keys[current_player.piece][index]
+        self.mirror_hash ^= self.zobrist_keys[current_player.piece][mirror_index]
+        self.update_scores(index, column, current_player.piece, 1)
+        self.heights[column] = row + 1
+        self.move_history.append(column)
+
+    def undo_move(self):
+        # takes back the last dropped piece so the search can reuse one board instead of copying it at every node
+        column = self.move_history.pop()
+        row = self.heights[column] - 1
+        index = column * self.column_height + row
+        mirror_index = (self.num_of_columns - 1 - column) * self.column_height + row
+        bit = 1 << index
+        piece = 1 if self.bitboards[1] & bit else 2
+        self.hash ^= self.zobrist_keys[piece][index]
+        self.mirror_hash ^= self.zobrist_keys[piece][mirror_index]
+        self.update_scores(index, column, piece, -1)
+        self.bitboards[1] &= ~bit
+        self.bitboards[2] &= ~bit
+        self.heights[column] = row
+
+    def update_scores(self, index, column, piece, change):
+        # adds (change 1) or removes (change -1) a piece from the counts of the windows it is in and updates the
+        # position score of both players by the difference in those windows' scores
+        opposing_piece = 3 - piece
+        counts = self.window_counts[piece]
+        opposing_counts = self.window_counts[opposing_piece]
+        window_scores = self.window_scores
+        score = self.position_scores[piece]
+        opposing_score = self.position_scores[opposing_piece]
+        for w in self.cell_windows[index]:
+            count, opposing_count = counts[w], opposing_counts[w]
+            counts[w] = count + change
+            score += window_scores[count + change][opposing_count] - window_scores[count][opposing_count]
+            opposing_score += window_scores[opposing_count][count + change] - window_scores[opposing_count][count]
+        # pieces in the center column are worth 3 points, with an even number of columns both middle columns count
+        if column == self.num_of_columns // 2 or column == (self.num_of_columns - 1) // 2:
+            score += 3 * change
+        self.position_scores[piece] = score
+        self.position_scores[opposing_piece] = opposing_score
+
+    def copy(self):
+        # the copy shares the transposition table and move ordering tables so a search on it helps later searches
+        board_copy = Board(self.num_of_columns, self.num_of_rows, self.num_to_connect, self.transposition_table)
+        board_copy.killer_moves = self.killer_moves
+        board_copy.history_scores = self.history_scores
+        board_copy.bitboards = self.bitboards.copy()
+        board_copy.heights = self.heights.copy()
+        board_copy.move_history = self.move_history.copy()
+        board_copy.hash = self.hash
+        board_copy.mirror_hash = self.mirror_hash
+        board_copy.window_counts = [counts.copy() for counts in self.window_counts]
+        board_copy.position_scores = self.position_scores.copy()
+        return board_copy
+
+    def canonical_hash(self):
+        return min(self.hash, self.mirror_hash)
+
+    def is_mirrored(self):
+        # true when the canonical hash is the one of the mirror image, moves stored under it have to be mirrored
+        return self.mirror_hash < self.hash
+
+    def is_symmetric(self):
+        return self.hash == self.mirror_hash
+
+    def mirror_column(self, column):
+        return self.num_of_columns - 1 - column
+
+    def is_valid_move(self, column):
+        if column in range(self.num_of_columns):
+            return self.heights[column] < self.num_of_rows
+        return False
+
+    def get_next_open_row(self, column):
+        if self.heights[column] < self.num_of_rows:
+            return self.heights[column]
+
+    def is_winning_move(self, row, column, current_player):
+        # the game ends as soon as any line is connected, so a connected line on the board has to go through the
+        # piece that was just dropped and checking the whole bitboard is the same as checking around (row, column)
+        return self.has_connected(self.bitboards[current_player.piece])
+
+    def playable_cells(self):
+        # the cell the next piece of every column that isn't full lands in
+        return ((self.bitboards[1] | self.bitboards[2]) + self.geometry.bottom_mask) & self.geometry.board_mask
+
+    def winning_cells(self, piece):
+        # empty cells, playable now or not, that would connect a line of piece
+        return self.geometry.winning_cells(self.bitboards[piece], self.bitboards[1] | self.bitboards[2])
+
+    def cell_column(self, cell):
+        # the column of the lowest cell in a bitboard
+        return ((cell & -cell).bit_length() - 1) // self.column_height
+
+    def cell_columns(self, cells):
+        # the columns with any of the cells in a bitboard, centre first
+        return [c for c in self.center_order if cells & self.geometry.column_masks[c]]
+
+    def analyze_threats(self, current_player, opposing_player):
+        # finds the immediate wins, the forced blocks, the moves that lose right away and the moves that make a double
+        # threat for current_player, who is to move
+        geometry = self.geometry
+        mask = self.bitboards[1] | self.bitboards[2]
+        playable = (mask + geometry.bottom_mask) & geometry.board_mask
+        position = self.bitboards[current_player.piece]
+        wins = geometry.winning_cells(position, mask)
+        opposing_wins = geometry.winning_cells(self.bitboards[opposing_player.piece], mask)
+        forced = opposing_wins & playable
+        losing = playable & (opposing_wins >> 1)
+        safe = 0
+        if not forced & (forced - 1):  # two opponent winning cells can't both be blocked
+            safe = (forced or playable) & ~losing
+        double_threats = []
+        for column in self.cell_columns(safe):
+            # after the move the opponent can't win right away but the player wins next in two places, or in a place
+            # with another winning cell right above it that the opponent's block makes playable
+            move = playable & geometry.column_masks[column]
+            new_mask = mask | move
+            new_playable = (new_mask + geometry.bottom_mask) & geometry.board_mask
+            if opposing_wins & ~move & new_playable:
+                continue
+            new_wins = geometry.winning_cells(position | move, new_mask)
+            immediate = new_wins & new_playable
+            if immediate & (immediate - 1) or immediate & (new_wins >> 1):
+                double_threats.append(column)
+        return ThreatAnalysis(self.cell_columns(wins & playable), self.cell_columns(forced), self.cell_columns(losing),
+                              self.cell_columns(safe), double_threats)
+
+    def evaluate_window(self, window_current_piece_count, window_empty_count, window_opposing_piece_count):
+        return evaluate_window(self.num_to_connect, window_current_piece_count, window_empty_count,
+                               window_opposing_piece_count)
+
+    def score_position(self, column, row, current_player, opposing_player):
+        # the score of every window on the board and the center column is kept up to date by update_scores, so this
+        # is only a lookup. column and row are not needed anymore
+        return self.position_scores[current_player.piece]
+
+    def is_terminal_node(self, row, column, current_player, opposing_player):
+        return (self.is_winning_move(row, column, current_player)
+                or self.is_winning_move(row, column, opposing_player)
+                or len(self.get_valid_locations()) == 0)
+
+    def minimax(self, depth, alpha, beta, maximizing_player, row, column, current_player, opposing_player):
+        # scores are from current_player's point of view like before, the search itself is done by negamax which
+        # always scores from the point of view of the player to move
+        self.search_player, self.search_opponent = current_player, opposing_player
+        # a direct call has no principal variation to follow, whatever an earlier iterative_deepening left behind, and
+        # its counts and search_stats are only of this search
+        self.search_root_length = len(self.move_history)
+        self.principal_variation = []
+        self.following_principal_variation = False
+        self.nodes_searched = 0
+        self.search_stats = SearchStats(self.num_of_columns)
+        table_hits, table_misses = self.transposition_table.hits, self.transposition_table.misses
+        start = time.perf_counter()
+        if maximizing_player:
+            col, value = self.negamax(depth, alpha, beta, row, column, current_player, opposing_player)
+        else:
+            col, value = self.negamax(depth, -beta, -alpha, row, column, opposing_player, current_player)
+            value = -value
+        self.search_stats.nodes = self.nodes_searched
+        self.search_stats.table_hits = self.transposition_table.hits - table_hits
+        self.search_stats.table_lookups = self.search_stats.table_hits + self.transposition_table.misses - table_misses
+        self.search_stats.depth = depth
+        self.search_stats.elapsed_time = time.perf_counter() - start
+        return col, value
+
+    def negamax(self, depth, alpha, beta, row, column, current_player, opposing_player):
+        # principal variation search: the first move is searched with the full window, the others only with a null
+        # window that proves they are not better and are searched again if they turn out to be
+        self.nodes_searched += 1
+        if self.node_budget is not None and self.nodes_searched > self.node_budget:
+            raise SearchTimeout()
+        if self.nodes_searched % 256 == 0:
+            if self.deadline is not None and time.perf_counter() > self.deadline:
+                raise SearchTimeout()
+            if self.stop_event is not None and self.stop_event.is_set():
+                raise SearchTimeout()
+        on_principal_variation = self.following_principal_variation
+
+        if self.has_connected(self.bitboards[opposing_player.piece]):  # the last move won the game
+            return None, -WINNING_SCORE
+        if len(self.move_history) == self.num_of_columns * self.num_of_rows:  # game over, no valid moves
+            return None, 0
+        if depth == 0:
+            self.search_stats.leaf_evaluations += 1
+            score = self.score_position(column, row, self.search_player, self.search_opponent)
+            return None, score if current_player.piece == self.search_player.piece else -score
+
+        # positions that were already searched deep enough through another move order don't need to be searched again.
+        # A position and its mirror image share an entry, which stores the move as played in the canonical one. At the
+        # root the entry only orders the moves: it may be left from an earlier search that wasn't limited to the moves
+        # this one is
+        alpha_original = alpha
+        ply = len(self.move_history)
+        mirrored = self.is_mirrored()
+        key = self.canonical_hash() ^ self.perspective_keys[self.search_player.piece]
+        entry = self.transposition_table.lookup(key)
+        table_move = None
+        if entry is not None:
+            entry_key, entry_depth, entry_value, entry_bound, table_move = entry
+            if mirrored:
+                table_move = self.mirror_column(table_move)
+            if entry_depth >= depth and ply != self.search_root_length:
+                if entry_bound == TranspositionTable.EXACT:
+                    return table_move, entry_value
+                elif entry_bound == TranspositionTable.LOWER_BOUND:
+                    alpha = max(alpha, entry_value)
+                else:
+                    beta = min(beta, entry_value)
+                if alpha >= beta:
+                    return table_move, entry_value
+
+        # threats decide some positions without a search: the player to move wins when they can play in one of their
+        # winning cells and loses when the opponent has two they can play in. Otherwise the opponent's winning cell
+        # has to be blocked and moves right below one of them lose, those branches are never searched. Right above
+        # the leaves the check costs more than the few nodes it saves
+        geometry = self.geometry
+        allowed = -1
+        if depth >= 2:
+            mask = self.bitboards[1] | self.bitboards[2]
+            playable = (mask + geometry.bottom_mask) & geometry.board_mask
+            if self.root_moves is not None and ply == self.search_root_length:
+                # only the moves this search was given can be played at the root
+                playable &= sum(geometry.column_masks[c] for c in self.root_moves)
+            winning = geometry.winning_cells(self.bitboards[current_player.piece], mask) & playable
+            if winning:
+                return self.cell_column(winning), WINNING_SCORE
+            opposing_wins = geometry.winning_cells(self.bitboards[opposing_player.piece], mask)
+            forced = opposing_wins & playable
+            if forced & (forced - 1):
+                return self.cell_column(forced), -WINNING_SCORE
+            allowed = (forced or playable) & ~(opposing_wins >> 1)
+            if not allowed:
+                return self.cell_column(playable), -WINNING_SCORE
+
+        principal_move = None
+        if on_principal_variation and ply - self.search_root_length < len(self.principal_variation):
+            principal_move = self.principal_variation[ply - self.search_root_length]
+
+        moves = [c for c in self.order_moves(current_player, ply, table_move, principal_move)
+                 if allowed & geometry.column_masks[c]]
+        if self.root_moves is not None and ply == self.search_root_length:
+            moves = [c for c in moves if c in self.root_moves]
+            if not moves:  # every move this search was given lets the opponent win
+                return self.root_moves[0], -WINNING_SCORE
+        elif self.is_symmetric():
+            # in a symmetric position a move and its mirror image lead to mirror image positions, only one is searched
+            moves = [c for c in moves if c <= self.mirror_column(c)]
+
+        value = -math.inf
+        col = None
+        for index, c in enumerate(moves):
+            r = self.heights[c]
+            self.following_principal_variation = c == principal_move
+            self.drop_piece(r, c, current_player)
+            if index == 0:
+                score = -self.negamax(depth - 1, -beta, -alpha, r, c, opposing_player, current_player)[1]
+            else:
+                score = -self.negamax(depth - 1, -alpha - 1, -alpha, r, c, opposing_player, current_player)[1]
+                if alpha < score < beta:
+                    score = -self.negamax(depth - 1, -beta, -score, r, c, opposing_player, current_player)[1]
+            self.undo_move()
+            if score > value:
+                value = score
+                col = c
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                self.search_stats.cutoffs_by_move_index[index] += 1
+                # remember the move that caused the cutoff so it is tried early in sibling positions
+                killers = self.killer_moves[ply]
+                if killers[0] != c:
+                    killers[1] = killers[0]
+                    killers[0] = c
+                self.history_scores[current_player.piece][c * self.column_height + r] += depth * depth
+                break
+
+        if value <= alpha_original:
+            bound = TranspositionTable.UPPER_BOUND
+        elif value >= beta:
+            bound = TranspositionTable.LOWER_BOUND
+        else:
+            bound = TranspositionTable.EXACT
+        # a root limited to root_moves only found the best of those moves, which isn't the value of the position for
+        # a later search that reaches it through another move
+        if self.root_moves is None or ply != self.search_root_length:
+            self.transposition_table.store(key, depth, value, bound, self.mirror_column(col) if mirrored else col)
+        return col, value
+
+    def order_moves(self, current_player, ply, table_move, principal_move):
+        # centre columns first, then by history score, and then the killer moves, the transposition table move and
+        # the principal variation move are moved to the front, so the principal variation move ends up first
+        history = self.history_scores[current_player.piece]
+        moves = [c for c in self.center_order if self.heights[c] < self.num_of_rows]
+        moves.sort(key=lambda c: history[c * self.column_height + self.heights[c]], reverse=True)
+        killers = self.killer_moves[ply]
+        for move in (killers[1], killers[0], table_move, principal_move):
+            if move is not None and move in moves:
+                moves.remove(move)
+                moves.insert(0, move)
+        return moves
+
+    def iterative_deepening(self, current_player, opposing_player, time_budget_ms=1000, node_budget=None,
+                            max_depth=None, root_moves=None, progress_callback=None):
+        # searches one ply deeper at a time until the time or node budget runs out and returns the best move, score and
+        # depth of the deepest search that finished. root_moves limits the search to some of the columns and
+        # progress_callback is called with the depth, move and score of every iteration that finished
+        if max_depth is None:
+            max_depth = self.num_of_columns * self.num_of_rows - len(self.move_history)
+        # positions decided by threats are answered without a full search: a move that makes a double threat is the
+        # only one searched, and when only one move doesn't lose right away it is played without a search
+        forced_move = None
+        if root_moves is None:
+            threats = self.analyze_threats(current_player, opposing_player)
+            forced_move = threats.forced_move()
+            if threats.double_threats and not threats.winning_moves:
+                root_moves = threats.double_threats[:1]
+        self.root_moves = root_moves
+        self.iteration_results = []
+        self.nodes_searched = 0
+        self.search_root_length = len(self.move_history)
+        self.principal_variation = []
+        self.search_player, self.search_opponent = current_player, opposing_player
+        self.search_stats = SearchStats(self.num_of_columns)
+        table_hits, table_misses = self.transposition_table.hits, self.transposition_table.misses
+        best_column, best_score, depth_reached = None, 0, 0
+        start = time.perf_counter()
+        if forced_move is not None:
+            # scored like a leaf of the search, depth 0 says that nothing was searched
+            self.drop_piece(self.heights[forced_move], forced_move, current_player)
+            best_column, best_score = forced_move, self.score_position(forced_move, 0, current_player, opposing_player)
+            self.undo_move()
+            self.principal_variation = [forced_move]
+            max_depth = 0
+        for depth in range(1, max_depth + 1):
+            self.following_principal_variation = True
+            try:
+                column, score = self.negamax(depth, -math.inf, math.inf, 0, 0, current_player, opposing_player)
+            except SearchTimeout:
+                # put the board back the way it was before the unfinished search
+                while len(self.move_history) > self.search_root_length:
+                    self.undo_move()
+                break
+            best_column, best_score, depth_reached = column, score, depth
+            self.iteration_results.append((depth, column, score))
+            if progress_callback is not None:
+                progress_callback(depth, column, score)
+            self.principal_variation = self.get_principal_variation(current_player, opposing_player, depth)
+            if abs(score) >= WINNING_SCORE:  # searching deeper won't change the move
+                break
+            # the budget only starts after the first iteration so there is always a move to return
+            if depth == 1:
+                if time_budget_ms is not None:
+                    self.deadline = start + time_budget_ms / 1000
+                self.node_budget = node_budget
+        self.deadline = None
+        self.node_budget = None
+        self.root_moves = None
+        self.search_stats.nodes = self.nodes_searched
+        self.search_stats.table_hits = self.transposition_table.hits - table_hits
+        self.search_stats.table_lookups = self.search_stats.table_hits + self.transposition_table.misses - table_misses
+        self.search_stats.depth = depth_reached
+        self.search_stats.elapsed_time = time.perf_counter() - start
+        return best_column, best_score, depth_reached
+
+    def get_principal_variation(self, current_player, opposing_player, depth):
+        # follows the best moves stored in the transposition table from the current position
+        principal_variation = []
+        players = (current_player, opposing_player)
+        for ply in range(depth):
+            entry = self.transposition_table.lookup(self.canonical_hash() ^ self.perspective_keys[current_player.piece])
+            if entry is None:
+                break
+            column = self.mirror_column(entry[4]) if self.is_mirrored() else entry[4]
+            if not self.is_valid_move(column):
+                break
+            row = self.get_next_open_row(column)
+            principal_variation.append(column)
+            self.drop_piece(row, column, players[ply % 2])
+            if self.is_winning_move(row, column, players[ply % 2]):
+                break
+        for column in principal_variation:
+            self.undo_move()
+        return principal_variation
+
+    def get_valid_locations(self):
+        valid_locations = []
+        for c in range(self.num_of_columns):
+            if self.is_valid_move(c):
+                valid_locations.append(c)
+        return valid_locations
+
+    def pick_best_move(self, current_player, opposing_player):
+        valid_locations = self.get_valid_locations()
+        best_score = 0
+        best_column = random.choice(valid_locations)
+        for c in valid_locations:
+            r = self.get_next_open_row(c)
+            self.drop_piece(r, c, current_player)
+            score = self.score_position(c, r, current_player, opposing_player)
+            self.undo_move()
+            if score > best_score:
+                best_score = score
+                best_column = c
+        return best_column
+
+
+def board_from_grid(grid, num_to_connect, transposition_table=None):
+    # builds a Board holding the pieces of a (num_of_rows, num_of_columns) grid laid out like Board.board
+    num_of_rows, num_of_columns = len(grid), len(grid[0])
+    board = Board(num_of_columns, num_of_rows, num_to_connect, transposition_table)
+    players = [None, Player('Red', 1, True), Player('Yellow', 2, True)]
+    for c in range(num_of_columns):
+        for r in range(num_of_rows):
+            if grid[r][c] == 0:
+                break
+            board.drop_piece(r, c, players[int(grid[r][c])])
+    return board
+
+
+def search_root_moves(grid, num_to_connect, current_piece, root_moves, depth, time_budget_ms):
+    # runs in a worker process of ParallelSearch: searches some of the root moves of the position in grid and returns
+    # the results of every finished iteration and the stats of the search
+    board = board_from_grid(grid, num_to_connect)
+    current_player = Player('', current_piece, True)
+    opposing_player = Player('', 3 - current_piece, True)
+    board.iterative_deepening(current_player, opposing_player, time_budget_ms, max_depth=depth, root_moves=root_moves)
+    return board.iteration_results, board.search_stats
+
+
+class ParallelSearch:
+    # root-parallel search: the root moves are split between worker processes that each search their share with their
+    # own transposition table. The best moves of the shares are compared at the deepest depth all of them finished and
+    # ties are broken with the seed, so a depth limited search always returns the same move for the same seed
+    def __init__(self, workers=None, seed=0):
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed
+        self.executor = None
+        self.nodes_searched = 0
+        self.elapsed_time = 0
+        self.search_stats = SearchStats()
+
+    def search(self, board, current_player, opposing_player, depth=None, time_budget_ms=None):
+        if depth is None and time_budget_ms is None:
+            time_budget_ms = 1000
+        if self.executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(self.workers)
+        valid_locations = [c for c in board.center_order if board.is_valid_move(c)]
+        if board.is_symmetric():
+            valid_locations = [c for c in valid_locations if c <= board.mirror_column(c)]
+        shares = [valid_locations[i::self.workers] for i in range(min(self.workers, len(valid_locations)))]
+        start = time.perf_counter()
+        futures = [self.executor.submit(search_root_moves, board.board, board.num_to_connect, current_player.piece,
+                                        share, depth, time_budget_ms) for share in shares]
+        results = [future.result() for future in futures]
+        self.elapsed_time = time.perf_counter() - start
+        self.search_stats = SearchStats(board.num_of_columns)
+        for iterations, stats in results:
+            self.search_stats.add(stats)
+        self.nodes_searched = self.search_stats.nodes
+
+        # a share whose result is forced stops early, its last result holds at any deeper depth
+        unforced_depths = [iterations[-1][0] for iterations, stats in results
+                           if abs(iterations[-1][2]) < WINNING_SCORE]
+        if unforced_depths:
+            depth_reached = min(unforced_depths)
+        else:
+            depth_reached = max(iterations[-1][0] for iterations, stats in results)
+        candidates = []
+        for iterations, stats in results:
+            share_depth, column, score = iterations[min(depth_reached, len(iterations)) - 1]
+            # of two won positions the one proven at the lower depth wins sooner
+            candidates.append((score, -share_depth if score >= WINNING_SCORE else 0, column, share_depth))
+        best = max(candidate[:2] for candidate in candidates)
+        best_columns = [candidate[2] for candidate in candidates if candidate[:2] == best]
+        tie_breaker = random.Random(self.seed * 1000 + len(board.move_history))
+        best_column = tie_breaker.choice(best_columns)
+        if not unforced_depths:
+            # every share is decided, the depth is the one the result of the chosen move was found at
+            depth_reached = next(candidate[3] for candidate in candidates if candidate[2] == best_column)
+        self.search_stats.depth = depth_reached
+        self.search_stats.elapsed_time = self.elapsed_time
+        return best_column, best[0], depth_reached
+
+    def nodes_per_second(self):
+        return self.nodes_searched / self.elapsed_time if self.elapsed_time else 0.0
+
+    def close(self, wait=True):
+        # without waiting, searches that didn't start yet are cancelled and running ones are left to finish
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait, cancel_futures=not wait)
+            self.executor = None
+
+
+class Solver:
+    # exact solver for boards small enough to search to the end. Scores are from the point of view of the player to
+    # move: positive is a win, negative a loss and 0 a draw, and the sooner the game is won the larger the score.
+    # Positions are two integers, the pieces of the player to move and a mask of all pieces, laid out like the
+    # bitboards of Board
+    def __init__(self, num_of_columns, num_of_rows, num_to_connect, transposition_table=None):
+        self.num_of_columns = num_of_columns
+        self.num_of_rows = num_of_rows
+        self.num_to_connect = num_to_connect
+        self.num_of_cells = num_of_columns * num_of_rows
+        # the masks, winning cell search and move order are shared with every Board of the size
+        self.geometry = get_geometry(num_of_columns, num_of_rows, num_to_connect)
+        if transposition_table is None:
+            transposition_table = TranspositionTable(256)
+        self.transposition_table = transposition_table
+        self.nodes_searched = 0
+        self.elapsed_time = 0
+        # a solve stops with SearchTimeout at the deadline or when stop_event (a threading.Event) is set, the table
+        # keeps what it found so a later solve of the same game is faster
+        self.deadline = None
+        self.stop_event = None
+
+    def negamax(self, position, mask, moves_played, alpha, beta):
+        # the player to move can't win with their next move, solve_position checks that and the moves searched here
+        # never leave the opponent a winning move
+        self.nodes_searched += 1
+        if self.nodes_searched % 1024 == 0:
+            if self.deadline is not None and time.perf_counter() > self.deadline:
+                raise SearchTimeout()
+            if self.stop_event is not None and self.stop_event.is_set():
+                raise SearchTimeout()
+        geometry = self.geometry
+        opponent_wins = geometry.winning_cells(position ^ mask, mask)
+        possible = (mask + geometry.bottom_mask) & geometry.board_mask
+        forced = possible & opponent_wins
+        if forced:
+            if forced & (forced - 1):  # the opponent has two winning moves and only one can be blocked
+                return -((self.num_of_cells - moves_played) // 2)
+            possible = forced
+        possible &= ~(opponent_wins >> 1)  # playing right below a cell the opponent wins with loses
+        if not possible:
+            return -((self.num_of_cells - moves_played) // 2)
+        if moves_played >= self.num_of_cells - 2:  # neither player can win with the last two pieces
+            return 0
+
+        lowest = -((self.num_of_cells - 2 - moves_played) // 2)
+        if alpha < lowest:
+            alpha = lowest
+            if alpha >= beta:
+                return alpha
+        # position + mask is unique for every position, the table stores upper bounds
+        key = position + mask
+        entry = self.transposition_table.lookup(key)
+        highest = entry[2] if entry is not None else (self.num_of_cells - 1 - moves_played) // 2
+        if beta > highest:
+            beta = highest
+            if alpha >= beta:
+                return beta
+
+        # moves that make the most new winning cells first, centre columns first when they make as many
+        moves = []
+        for column in geometry.center_order:
+            move = possible & geometry.column_masks[column]
+            if move:
+                threats = bin(geometry.winning_cells(position | move, mask)).count('1')
+                moves.append((-threats, len(moves), move))
+        moves.sort()
+        for threats, order, move in moves:
+            score = -self.negamax(position ^ mask, mask | move, moves_played + 1, -beta, -alpha)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        self.transposition_table.store(key, 0, alpha, TranspositionTable.UPPER_BOUND, None)
+        return alpha
+
+    def solve_position(self, position, mask, moves_played, weak=False):
+        # narrows the score down with null window searches. A weak solve only finds out who wins
+        if self.geometry.winning_cells(position, mask) & (mask + self.geometry.bottom_mask):
+            return (self.num_of_cells + 1 - moves_played) // 2
+        lowest = -((self.num_of_cells - moves_played) // 2)
+        highest = (self.num_of_cells + 1 - moves_played) // 2
+        if weak:
+            lowest, highest = -1, 1
+        while lowest < highest:
+            middle = lowest + (highest - lowest) // 2
+            # searching closer to 0 first is faster, most positions are not decided by a long way
+            if middle <= 0 and int(lowest / 2) < middle:
+                middle = int(lowest / 2)
+            elif middle >= 0 and highest // 2 > middle:
+                middle = highest // 2
+            result = self.negamax(position, mask, moves_played, middle, middle + 1)
+            if result <= middle:
+                highest = result
+            else:
+                lowest = result
+        return lowest
+
+    def solve(self, board, current_player, weak=False, time_budget_ms=None):
+        # exact score of the position on the board for current_player, who is to move. Raises SearchTimeout when
+        # time_budget_ms runs out first
+        position = board.bitboards[current_player.piece]
+        mask = board.bitboards[1] | board.bitboards[2]
+        self.nodes_searched = 0
+        start = time.perf_counter()
+        self.deadline = start + time_budget_ms / 1000 if time_budget_ms is not None else None
+        try:
+            return self.solve_position(position, mask, bin(mask).count('1'), weak)
+        finally:
+            self.deadline = None
+            self.elapsed_time = time.perf_counter() - start
+
+    def best_move(self, board, current_player, time_budget_ms=None):
+        # returns the column with the best exact score and that score. Raises SearchTimeout when time_budget_ms runs
+        # out first
+        position = board.bitboards[current_player.piece]
+        mask = board.bitboards[1] | board.bitboards[2]
+        moves_played = bin(mask).count('1')
+        self.nodes_searched = 0
+        start = time.perf_counter()
+        self.deadline = start + time_budget_ms / 1000 if time_budget_ms is not None else None
+        best_column, best_score = None, -math.inf
+        geometry = self.geometry
+        try:
+            for column in geometry.center_order:
+                move = (mask + geometry.bottom_mask) & geometry.column_masks[column]
+                if not move:
+                    continue
+                if geometry.winning_cells(position, mask) & move:
+                    best_column, best_score = column, (self.num_of_cells + 1 - moves_played) // 2
+                    break
+                score = -self.solve_position(position ^ mask, mask | move, moves_played + 1)
+                if score > best_score:
+                    best_column, best_score = column, score
+        finally:
+            self.deadline = None
+            self.elapsed_time = time.perf_counter() - start
+        return best_column, best_score
+
+    def outcome(self, score, moves_played):
+        # turns a score into 'win', 'loss' or 'draw' for the player to move and the number of moves until the game ends
+        if score == 0:
+            return 'draw', self.num_of_cells - moves_played
+        # the winner's last piece is piece number num_of_cells + 1 - 2 * |score| or the one after, whichever the
+        # winner drops
+        for last_piece in (self.num_of_cells + 1 - 2 * abs(score), self.num_of_cells + 2 - 2 * abs(score)):
+            if (last_piece - moves_played) % 2 == (1 if score > 0 else 0):
+                return ('win' if score > 0 else 'loss'), last_piece - moves_played
+
+    def nodes_per_second(self):
+        return self.nodes_searched / self.elapsed_time if self.elapsed_time else 0.0
+
+
+class BatchEvaluator:
+    # scores many positions of one board size at once with numpy instead of one Board at a time. It uses the same
+    # windows and window scores as Board so the results match Board.score_position and Board.is_winning_move
+    def __init__(self, num_of_columns, num_of_rows, num_to_connect, chunk_size=4096):
+        import numpy as np
+        geometry = get_geometry(num_of_columns, num_of_rows, num_to_connect)
+        self.num_of_columns = num_of_columns
+        self.num_of_rows = num_of_rows
+        self.num_to_connect = num_to_connect
+        self.chunk_size = chunk_size  # boards scored together, bounds the memory used by the window arrays
+        self.window_indices = np.array(geometry.grid_windows)
+        self.window_scores = np.array(geometry.window_scores)
+        # with an even number of columns both middle columns count, like in Board.update_scores
+        self.center_columns = sorted({num_of_columns // 2, (num_of_columns - 1) // 2})
+
+    def evaluate(self, boards, piece=1):
+        # boards is an (N, num_of_rows, num_of_columns) array laid out like Board.board. Returns the score of every
+        # board for the given piece, the winning piece of every board (0 if nobody won) and which boards are draws
+        import numpy as np
+        boards = np.asarray(boards, dtype=np.int8).reshape(-1, self.num_of_rows * self.num_of_columns)
+        scores = np.empty(len(boards), dtype=np.int64)
+        winners = np.zeros(len(boards), dtype=np.int8)
+        for start in range(0, len(boards), self.chunk_size):
+            chunk = boards[start:start + self.chunk_size]
+            cells = chunk[:, self.window_indices]
+            counts = [None, np.count_nonzero(cells == 1, axis=2), np.count_nonzero(cells == 2, axis=2)]
+            center = chunk.reshape(-1, self.num_of_rows, self.num_of_columns)[:, :, self.center_columns]
+            scores[start:start + self.chunk_size] = (self.window_scores[counts[piece], counts[3 - piece]].sum(axis=1)
+                                                     + 3 * np.count_nonzero(center == piece, axis=(1, 2)))
+            chunk_winners = winners[start:start + self.chunk_size]
+            chunk_winners[(counts[2] == self.num_to_connect).any(axis=1)] = 2
+            chunk_winners[(counts[1] == self.num_to_connect).any(axis=1)] = 1
+        draws = (winners == 0) & (boards != 0).all(axis=1)
+        return scores, winners, draws
+
+
+class TreeNode:
+    # a position in the tree of MonteCarloSearch, reached by piece dropping a piece in column move
+    def __init__(self, move=None, piece=None, parent=None):
+        self.move = move
+        self.piece = piece
+        self.parent = parent
+        self.children = []
+        self.untried_moves = None  # columns without a child yet, filled the first time the node is expanded
+        self.visits = 0
+        self.wins = 0.0  # wins of piece in the playouts through the node, a draw counts half
+        self.winner = None  # set when the game is over in this position: the winning piece, or 0 for a draw
+
+
+def monte_carlo_root_visits(grid, num_to_connect, current_piece, time_budget_ms, max_simulations, seed, settings):
+    # runs in a worker process of MonteCarloSearch: searches the position in grid with its own tree and returns the
+    # visits and wins of every root move and the number of simulations
+    board = board_from_grid(grid, num_to_connect)
+    search = MonteCarloSearch(board.num_of_columns, board.num_of_rows, num_to_connect, seed=seed, **settings)
+    search.search(board, Player('', current_piece, True), Player('', 3 - current_piece, True), time_budget_ms,
+                  max_simulations)
+    return {child.move: (child.visits, child.wins) for child in search.root.children}, search.simulations
+
+
+class MonteCarloSearch:
+    # Monte Carlo tree search with UCT. Every batch picks leaves_per_batch leaves and plays playouts_per_leaf random
+    # games to the end from each of them, all the games of a batch at once with numpy. The tree is kept between moves
+    # and reused when the new position is further down it. With more than one worker every worker process grows its
+    # own tree and the visits of the root moves are added up
+    def __init__(self, num_of_columns, num_of_rows, num_to_connect, exploration=1.4, leaves_per_batch=32,
+                 playouts_per_leaf=32, workers=1, seed=0):
+        import numpy as np
+        geometry = get_geometry(num_of_columns, num_of_rows, num_to_connect)
+        self.geometry = geometry
+        self.num_of_columns = num_of_columns
+        self.num_of_rows = num_of_rows
+        self.num_to_connect = num_to_connect
+        self.exploration = exploration
+        self.leaves_per_batch = leaves_per_batch
+        self.playouts_per_leaf = playouts_per_leaf
+        self.workers = workers
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.generator = np.random.default_rng(seed)
+        self.column_pool = np.zeros(0, dtype=np.int64)  # random columns for the playouts, see random_columns
+        self.column_pool_index = 0
+        self.column_height = geometry.column_height
+        # the position while walking down the tree, lighter than a Board that updates its evaluation on every drop
+        self.grid = None
+        self.heights = None
+        self.bitboards = None
+        self.moves_played = 0
+        self.executor = None
+        self.root = None
+        self.root_history = None
+        self.simulations = 0
+        self.elapsed_time = 0
+        # the playouts keep the lines of BoardGeometry.grid_cell_lines as one bitmask per game, player and line, so a
+        # drop only updates the four lines through its cell. A line has at most 64 cells
+        self.num_of_lines = geometry.num_of_grid_lines
+        self.cell_lines = np.array([[line for line, bit in lines] for lines in geometry.grid_cell_lines])
+        self.cell_bits = np.array([[1 << bit for line, bit in lines] for lines in geometry.grid_cell_lines],
+                                  dtype=np.uint64)
+        # the bits every cell sets in every line, a matrix product with it turns grids into lines
+        self.line_bits = np.zeros((num_of_rows * num_of_columns, self.num_of_lines), dtype=np.uint64)
+        for cell in range(num_of_rows * num_of_columns):
+            self.line_bits[cell, self.cell_lines[cell]] = self.cell_bits[cell]
+        # line &= line >> shift with these shifts leaves a bit where num_to_connect pieces are in a row: first for runs
+        # of 2, 4, 8 ... pieces and then with the last shift for num_to_connect
+        self.run_shifts = []
+        run_length = 1
+        while 2 * run_length <= num_to_connect:
+            self.run_shifts.append(np.uint64(run_length))
+            run_length *= 2
+        if run_length < num_to_connect:
+            self.run_shifts.append(np.uint64(num_to_connect - run_length))
+
+    def playout(self, boards, heights, pieces, playouts_per_board=1):
+        # plays playouts_per_board random games to the end from every board at once. boards is (N, num_of_rows *
+        # num_of_columns) laid out like a flattened Board.board, heights (N, num_of_columns) and pieces the piece to
+        # move on every board. Returns the winning piece of every game, 0 for a draw, the games of every board one
+        # after the other
+        import numpy as np
+        # the lines of every game and piece in one flat array, indexing it with one array of flat indices is much
+        # faster than indexing a 3-dimensional array with three. They are found once per board and then copied
+        num_of_lines = self.num_of_lines
+        lines = np.zeros((len(boards), 2, num_of_lines), dtype=np.uint64)
+        lines[:, 0] = (boards == 1).astype(np.uint64) @ self.line_bits
+        lines[:, 1] = (boards == 2).astype(np.uint64) @ self.line_bits
+        lines = np.repeat(lines, playouts_per_board, axis=0).ravel()
+        flat_heights = np.repeat(heights, playouts_per_board, axis=0).ravel()
+        pieces = np.repeat(pieces, playouts_per_board)
+        # every game is a draw once it filled its empty cells without a winner
+        empty_cells = np.repeat(np.count_nonzero(boards == 0, axis=1), playouts_per_board)
+        fewest_empty_cells = empty_cells.min()
+        num_of_games = len(pieces)
+        winners = np.zeros(num_of_games, dtype=np.int8)
+        games = np.arange(num_of_games)  # the games that are still being played
+        ply = 0
+        while games.size:
+            if ply >= fewest_empty_cells:
+                games = games[empty_cells[games] > ply]
+                if not games.size:
+                    break
+            # a random column, picked again for the games where it is full
+            columns = self.random_columns(games.size)
+            height_indices = games * self.num_of_columns + columns
+            rows = flat_heights[height_indices]
+            full = np.flatnonzero(rows == self.num_of_rows)
+            while full.size:
+                columns[full] = self.random_columns(full.size)
+                height_indices[full] = games[full] * self.num_of_columns + columns[full]
+                rows[full] = flat_heights[height_indices[full]]
+                full = full[rows[full] == self.num_of_rows]
+            flat_heights[height_indices] = rows + 1
+            dropped_cells = rows * self.num_of_columns + columns
+            # the piece to move at the start on even plies and the other one on odd plies
+            moving_pieces = pieces[games] if ply % 2 == 0 else 3 - pieces[games]
+            indices = ((games * 2 + moving_pieces - 1) * num_of_lines)[:, None] + self.cell_lines[dropped_cells]
+            masks = lines[indices] | self.cell_bits[dropped_cells]
+            lines[indices] = masks
+            # nobody connected before, so a run in the lines through the dropped cell goes through it
+            for shift in self.run_shifts:
+                masks &= masks >> shift
+            won = masks.any(axis=1)
+            winners[games[won]] = moving_pieces[won]
+            games = games[~won]
+            ply += 1
+        return winners
+
+    def random_columns(self, count):
+        # count random columns. The generator makes them in large blocks, drawing a few numbers at a time takes longer
+        # than the numbers themselves
+        if self.column_pool_index + count > len(self.column_pool):
+            self.column_pool = self.generator.integers(self.num_of_columns, size=max(count, 65536))
+            self.column_pool_index = 0
+        self.column_pool_index += count
+        return self.column_pool[self.column_pool_index - count:self.column_pool_index]
+
+    def play(self, column, piece):
+        row = self.heights[column]
+        self.grid[row * self.num_of_columns + column] = piece
+        self.bitboards[piece] |= 1 << (column * self.column_height + row)
+        self.heights[column] = row + 1
+        self.moves_played += 1
+
+    def take_back(self, column, piece):
+        row = self.heights[column] - 1
+        self.grid[row * self.num_of_columns + column] = 0
+        self.bitboards[piece] ^= 1 << (column * self.column_height + row)
+        self.heights[column] = row
+        self.moves_played -= 1
+
+    def select_child(self, node):
+        log_visits = math.log(node.visits)
+        return max(node.children, key=lambda child: child.wins / child.visits
+                   + self.exploration * math.sqrt(log_visits / child.visits))
+
+    def find_root(self, board, current_player):
+        # the node of the board's position when it is in the tree of the last search, else the root of a new tree
+        node = None
+        history = board.move_history
+        if self.root is not None and history[:len(self.root_history)] == self.root_history:
+            node = self.root
+            for column in history[len(self.root_history):]:
+                node = next((child for child in node.children if child.move == column), None)
+                if node is None:
+                    break
+        if node is None or node.piece != 3 - current_player.piece:
+            node = TreeNode(piece=3 - current_player.piece)
+        node.parent = None  # lets the rest of the old tree be freed
+        self.root = node
+        self.root_history = list(history)
+        return node
+
+    def backpropagate(self, node, wins):
+        # wins holds the wins of piece 1 and 2 at index 1 and 2, the visits were counted when the leaf was picked
+        while node is not None:
+            node.wins += wins[node.piece]
+            node = node.parent
+
+    def run_batch(self, root):
+        import numpy as np
+        leaves = []
+        for i in range(self.leaves_per_batch):
+            node = root
+            path = []
+            while node.winner is None and node.untried_moves == [] and node.children:
+                node = self.select_child(node)
+                self.play(node.move, node.piece)
+                path.append(node)
+            if node.winner is None:
+                if node.untried_moves is None:
+                    node.untried_moves = [c for c in range(self.num_of_columns) if self.heights[c] < self.num_of_rows]
+                    self.random.shuffle(node.untried_moves)
+                if node.untried_moves:
+                    column = node.untried_moves.pop()
+                    node.children.append(TreeNode(column, 3 - node.piece, node))
+                    node = node.children[-1]
+                    self.play(column, node.piece)
+                    path.append(node)
+                    if self.geometry.has_connected(self.bitboards[node.piece]):
+                        node.winner = node.piece
+                    elif self.moves_played == self.num_of_columns * self.num_of_rows:
+                        node.winner = 0
+                elif not node.children:
+                    node.winner = 0
+            # the visits are counted right away so the next leaves of the batch are picked elsewhere in the tree
+            parent = node
+            while parent is not None:
+                parent.visits += self.playouts_per_leaf
+                parent = parent.parent
+            if node.winner is None:
+                leaves.append((node, self.grid.copy(), list(self.heights)))
+            else:
+                wins = [0, 0, 0]
+                if node.winner == 0:
+                    wins[1] = wins[2] = 0.5 * self.playouts_per_leaf
+                else:
+                    wins[node.winner] = self.playouts_per_leaf
+                self.backpropagate(node, wins)
+            for node in reversed(path):
+                self.take_back(node.move, node.piece)
+        self.simulations += self.leaves_per_batch * self.playouts_per_leaf
+        if leaves:
+            boards = np.array([leaf[1] for leaf in leaves])
+            heights = np.array([leaf[2] for leaf in leaves])
+            pieces = np.array([3 - leaf[0].piece for leaf in leaves])
+            winners = self.playout(boards, heights, pieces, self.playouts_per_leaf)
+            winners = winners.reshape(len(leaves), self.playouts_per_leaf)
+            draws = 0.5 * np.count_nonzero(winners == 0, axis=1)
+            red_wins = np.count_nonzero(winners == 1, axis=1) + draws
+            yellow_wins = np.count_nonzero(winners == 2, axis=1) + draws
+            for i, leaf in enumerate(leaves):
+                self.backpropagate(leaf[0], [0, float(red_wins[i]), float(yellow_wins[i])])
+
+    def search(self, board, current_player, opposing_player, time_budget_ms=1000, max_simulations=None):
+        # returns the most visited column, the share of its playouts won by current_player and the number of
+        # simulations. Without max_simulations the search runs for time_budget_ms, with it and the same seed the
+        # search always returns the same result
+        if not board.get_valid_locations():
+            return None, 0.0, 0
+        # won and forced positions are answered right away, without simulations
+        threats = board.analyze_threats(current_player, opposing_player)
+        if threats.is_won():
+            return (threats.winning_moves or threats.double_threats)[0], 1.0, 0
+        if threats.forced_move() is not None:
+            return threats.forced_move(), 0.5, 0
+        if self.workers > 1:
+            return self.search_parallel(board, current_player, time_budget_ms, max_simulations)
+        start = time.perf_counter()
+        deadline = start + time_budget_ms / 1000 if max_simulations is None else None
+        root = self.find_root(board, current_player)
+        self.grid = board.board.ravel()
+        self.heights = list(board.heights)
+        self.bitboards = list(board.bitboards)
+        self.moves_played = len(board.move_history)
+        self.simulations = 0
+        while True:
+            self.run_batch(root)
+            if max_simulations is not None and self.simulations >= max_simulations:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            if board.stop_event is not None and board.stop_event.is_set():
+                break
+        self.elapsed_time = time.perf_counter() - start
+        best = max(root.children, key=lambda child: child.visits)
+        return best.move, float(best.wins / best.visits), self.simulations
+
+    def search_parallel(self, board, current_player, time_budget_ms, max_simulations):
+        if self.executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(self.workers)
+        settings = {'exploration': self.exploration, 'leaves_per_batch': self.leaves_per_batch,
+                    'playouts_per_leaf': self.playouts_per_leaf}
+        share = None if max_simulations is None else -(-max_simulations // self.workers)
+        start = time.perf_counter()
+        futures = [self.executor.submit(monte_carlo_root_visits, board.board, board.num_to_connect,
+                                        current_player.piece, time_budget_ms, share,
+                                        self.seed * 1000 + len(board.move_history) * self.workers + worker, settings)
+                   for worker in range(self.workers)]
+        results = [future.result() for future in futures]
+        self.elapsed_time = time.perf_counter() - start
+        visits, wins = {}, {}
+        for root_visits, simulations in results:
+            for column, (column_visits, column_wins) in root_visits.items():
+                visits[column] = visits.get(column, 0) + column_visits
+                wins[column] = wins.get(column, 0) + column_wins
+        self.simulations = sum(simulations for root_visits, simulations in results)
+        best = max(sorted(visits), key=lambda column: visits[column])
+        return best, float(wins[best] / visits[best]), self.simulations
+
+    def simulations_per_second(self):
+        return self.simulations / self.elapsed_time if self.elapsed_time else 0.0
+
+    def close(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait, cancel_futures=not wait)
+            self.executor = None
+
+
+class Player:
+    def __init__(self, name, piece, is_a_computer, engine='minimax'):
+        self.name = name
+        self.piece = piece
+        self.is_a_computer = is_a_computer
+        # how the computer picks its moves: 'minimax', 'mcts' for MonteCarloSearch or 'solver' for perfect play with
+        # Solver where it solves the position within the time budget, and minimax where it doesn't
+        self.engine = engine
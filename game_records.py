@@ -0,0 +1,116 @@
+import sys
+import struct
+import argparse
+from engine import Board, Player
+
+# record files start with this header, followed by the games one after another. Every game is a record header and
+# one byte per move with the column the piece was dropped in
+RECORD_MAGIC = b'C4GR'
+RECORD_VERSION = 1
+FILE_HEADER = struct.Struct('<4sBBBB')  # magic, version, columns, rows, number to connect
+RECORD_HEADER = struct.Struct('<BBH')  # piece that moved first, winning piece (0 for none), number of moves
+
+
+class GameRecord:
+    def __init__(self, moves, first_piece=1, winner=0):
+        self.moves = moves  # columns in the order the pieces were dropped
+        self.first_piece = first_piece
+        self.winner = winner
+
+    def replay(self, num_of_columns, num_of_rows, num_to_connect, transposition_table=None):
+        # returns the Board the moves lead to, dropped with Board.drop_piece like in a game
+        board = Board(num_of_columns, num_of_rows, num_to_connect, transposition_table)
+        players = [Player('', self.first_piece, True), Player('', 3 - self.first_piece, True)]
+        for ply, column in enumerate(self.moves):
+            board.drop_piece(board.get_next_open_row(column), column, players[ply % 2])
+        return board
+
+
+class GameRecordWriter:
+    # appends games to a record file one at a time, so any number of games can be written without keeping them
+    def __init__(self, path, num_of_columns, num_of_rows, num_to_connect):
+        if num_of_columns > 255:
+            raise ValueError("a record can't store columns above 255")
+        self.num_of_columns = num_of_columns
+        self.num_of_rows = num_of_rows
+        self.num_to_connect = num_to_connect
+        self.record_file = open(path, 'wb')
+        self.record_file.write(FILE_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, num_of_columns, num_of_rows,
+                                                num_to_connect))
+        self.games_written = 0
+
+    def write(self, moves, first_piece=1, winner=0):
+        self.record_file.write(RECORD_HEADER.pack(first_piece, winner, len(moves)))
+        self.record_file.write(bytes(moves))
+        self.games_written += 1
+
+    def close(self):
+        self.record_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+class GameRecordReader:
+    # reads the games of a record file one at a time while iterating over it, the file is never loaded all at once
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as record_file:
+            header = record_file.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size:
+            raise ValueError(f"{path} is not a game record file")
+        magic, version, num_of_columns, num_of_rows, num_to_connect = FILE_HEADER.unpack(header)
+        if magic != RECORD_MAGIC or version != RECORD_VERSION:
+            raise ValueError(f"{path} is not a version {RECORD_VERSION} game record file")
+        self.num_of_columns = num_of_columns
+        self.num_of_rows = num_of_rows
+        self.num_to_connect = num_to_connect
+
+    def __iter__(self):
+        with open(self.path, 'rb') as record_file:
+            record_file.seek(FILE_HEADER.size)
+            while True:
+                header = record_file.read(RECORD_HEADER.size)
+                if not header:
+                    return
+                if len(header) < RECORD_HEADER.size:
+                    raise ValueError(f"{self.path} ends in the middle of a game")
+                first_piece, winner, num_of_moves = RECORD_HEADER.unpack(header)
+                moves = record_file.read(num_of_moves)
+                if len(moves) < num_of_moves:
+                    raise ValueError(f"{self.path} ends in the middle of a game")
+                yield GameRecord(moves, first_piece, winner)
+
+    def replay(self, record, transposition_table=None):
+        return record.replay(self.num_of_columns, self.num_of_rows, self.num_to_connect, transposition_table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a game record file.')
+    parser.add_argument('path', help='game record file, e.g. written by tournament.py --records')
+    parser.add_argument('--verify', action='store_true',
+                        help='replay every game and check that the recorded winner won it')
+    args = parser.parse_args()
+    reader = GameRecordReader(args.path)
+    games, moves, wins = 0, 0, [0, 0, 0]
+    for record in reader:
+        games += 1
+        moves += len(record.moves)
+        wins[record.winner] += 1
+        if args.verify:
+            board = reader.replay(record)
+            winner = next((piece for piece in (1, 2) if board.has_connected(board.bitboards[piece])), 0)
+            if winner != record.winner:
+                print(f"game {games}: recorded winner {record.winner}, replayed winner {winner}", file=sys.stderr)
+                return 1
+    print(f"{games} games on {reader.num_of_columns}x{reader.num_of_rows}x{reader.num_to_connect}, "
+          f"{moves / games if games else 0:.1f} moves per game, red won {wins[1]}, yellow won {wins[2]}, "
+          f"no winner {wins[0]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,207 +1,46 @@
 import sys
 import random
 import math
-import numpy as np
-import pygame
+import threading
+import argparse
+from engine import Board, Player, ParallelSearch, MonteCarloSearch, Solver, SearchTimeout, profile_call
+from opening_book import get_opening_book
 
 
-class Board:
-    def __init__(self, num_of_columns, num_of_rows, num_to_connect):
-        self.num_of_columns = num_of_columns
-        self.num_of_rows = num_of_rows
-        self.num_to_connect = num_to_connect
-        self.board = np.zeros((num_of_rows, num_of_columns))
+# console output of games, set by the command line options
+game_options = {'print_boards': True, 'show_search_stats': False, 'profile_search': False, 'ai_workers': 1}
 
-    def drop_piece(self, row, column, current_player):
-        self.board[row][column] = current_player.piece
+# pygame is only imported when the first window opens, so programs that use the engine or create a Game without a
+# window never load it
+pygame = None
 
-    def is_valid_move(self, column):
-        if column in range(self.num_of_columns):
-            return self.board[self.num_of_rows - 1][column] == 0
-        return False
+# fonts by name and size, loading a system font is slow so every font is only loaded once
+fonts = {}
 
-    def get_next_open_row(self, column):
-        for row in range(self.num_of_rows):
-            if self.board[row][column] == 0:
-                return row
-
-    def is_winning_move(self, row, column, current_player):
-        # create a numpy array that contains the number of the current player's pieces that have to connect to win
-        piece = current_player.piece
-        winning_pattern = np.array([])
-        for i in range(self.num_to_connect):
-            winning_pattern = np.append(winning_pattern, piece)
-
-        # check part of the row that the piece was dropped on
-        for c in range(max(0, column - (self.num_to_connect - 1)),
-                       min(column + self.num_to_connect, self.num_of_columns - (self.num_to_connect - 1))):
-            if np.array_equal(self.board[row][c:c + self.num_to_connect], winning_pattern):
-                return True
 
-        # check part of the column that the piece was dropped on
-        for r in range(max(0, row - (self.num_to_connect - 1)),
-                       min(row + self.num_to_connect, self.num_of_rows - (self.num_to_connect - 1))):
-            if np.array_equal(self.board[:, column][r:r + self.num_to_connect], winning_pattern):
-                return True
+def load_pygame():
+    global pygame
+    if pygame is None:
+        import pygame as pygame_module
+        pygame_module.init()
+        pygame = pygame_module
+    return pygame
 
-        # check the / diagonal that the piece was dropped on
-        positive_diagonal = np.diag(self.board, column - row)
-        for d in range(len(positive_diagonal) - 3):
-            if np.array_equal(positive_diagonal[d:d + self.num_to_connect], winning_pattern):
-                return True
 
-        # check the \ diagonal that the piece was dropped on
-        negative_diagonal = np.diag(np.fliplr(self.board), abs(column - (self.num_of_columns - 1)) - row)
-        for d in range(len(negative_diagonal) - (self.num_to_connect - 1)):
-            if np.array_equal(negative_diagonal[d:d + self.num_to_connect], winning_pattern):
-                return True
+def get_font(name, size):
+    load_pygame()
+    if (name, size) not in fonts:
+        fonts[(name, size)] = pygame.font.SysFont(name, size)
+    return fonts[(name, size)]
 
-        return False
 
-    def evaluate_window(self, window_current_piece_count, window_empty_count, window_opposing_piece_count):
-        score = 0
-        if window_current_piece_count == 4:
-            score += 100
-        elif window_current_piece_count == 3 and window_empty_count == 1:
-            score += 5
-        elif window_current_piece_count == 2 and window_empty_count == 2:
-            score += 2
-
-        if window_opposing_piece_count == 3 and window_empty_count == 1:
-            score -= 4
-
-        return score
-
-    def score_position(self, column, row, current_player, opposing_player):
-        score = 0
-
-        # score center column
-        center_array = self.board[:, self.num_of_columns // 2]
-        center_count = np.count_nonzero(center_array == current_player.piece)
-        score += center_count * 3
-
-        # score horizontal
-        for c in range(max(0, column - (self.num_to_connect - 1)),
-                       min(column + self.num_to_connect, self.num_of_columns - (self.num_to_connect - 1))):
-            window_current_piece_count = (
-                np.count_nonzero(self.board[row][c:c + self.num_to_connect] == current_player.piece))
-            window_empty_count = np.count_nonzero(self.board[row][c:c + self.num_to_connect] == 0)
-            window_opposing_piece_count = np.count_nonzero(
-                self.board[row][c:c + self.num_to_connect] == opposing_player.piece)
-            score += self.evaluate_window(window_current_piece_count, window_empty_count, window_opposing_piece_count)
-
-        # score vertical
-        for r in range(max(0, row - (self.num_to_connect - 1)),
-                       min(row + self.num_to_connect, self.num_of_rows - (self.num_to_connect - 1))):
-            window_current_piece_count = (
-                np.count_nonzero(self.board[:, column][r:r + self.num_to_connect] == current_player.piece))
-            window_empty_count = np.count_nonzero(self.board[:, column][r:r + self.num_to_connect] == 0)
-            window_opposing_piece_count = (
-                np.count_nonzero(self.board[:, column][r:r + self.num_to_connect] == opposing_player.piece))
-            score += self.evaluate_window(window_current_piece_count, window_empty_count, window_opposing_piece_count)
-
-        # score / diagonal
-        positive_diagonal = np.diag(self.board, column - row)
-        for d in range(len(positive_diagonal) - (self.num_to_connect - 1)):
-            window_current_piece_count = (
-                np.count_nonzero(positive_diagonal[d:d + self.num_to_connect] == current_player.piece))
-            window_empty_count = np.count_nonzero(positive_diagonal[d:d + self.num_to_connect] == 0)
-            window_opposing_piece_count = (
-                np.count_nonzero(positive_diagonal[d:d + self.num_to_connect] == opposing_player.piece))
-            score += self.evaluate_window(window_current_piece_count, window_empty_count, window_opposing_piece_count)
-
-        # score \ diagonal
-        negative_diagonal = np.diag(np.fliplr(self.board), abs(column - (self.num_of_columns - 1)) - row)
-        for d in range(len(negative_diagonal) - (self.num_to_connect - 1)):
-            window_current_piece_count = (
-                np.count_nonzero(negative_diagonal[d:d + self.num_to_connect] == current_player.piece))
-            window_empty_count = np.count_nonzero(negative_diagonal[d:d + self.num_to_connect] == 0)
-            window_opposing_piece_count = (
-                np.count_nonzero(negative_diagonal[d:d + self.num_to_connect] == opposing_player.piece))
-            score += self.evaluate_window(window_current_piece_count, window_empty_count, window_opposing_piece_count)
-
-        return score
-
-    def is_terminal_node(self, row, column, current_player, opposing_player):
-        return (self.is_winning_move(row, column, current_player)
-                or self.is_winning_move(row, column, opposing_player)
-                or len(self.get_valid_locations()) == 0)
-
-    def minimax(self, depth, alpha, beta, maximizing_player, row, column, current_player, opposing_player):
-        valid_locations = self.get_valid_locations()
-        is_terminal = self.is_terminal_node(row, column, current_player, opposing_player)
-        if depth == 0 or is_terminal:
-            if is_terminal:
-                if self.is_winning_move(row, column, current_player):
-                    return None, 1000000000000000
-                elif self.is_winning_move(row, column, opposing_player):
-                    return None, -1000000000000000
-                else:  # game over, no valid moves
-                    return None, 0
-            else:  # depth is 0
-                return None, self.score_position(column, row, current_player, opposing_player)
-        if maximizing_player:
-            value = -math.inf
-            col = random.choice(valid_locations)
-            for c in valid_locations:
-                r = self.get_next_open_row(c)
-                b_copy = Board(self.num_of_columns, self.num_of_rows, self.num_to_connect)
-                b_copy.board = self.board.copy()
-                b_copy.drop_piece(r, c, current_player)
-                new_score = b_copy.minimax(depth - 1, alpha, beta, False, r, c, current_player, opposing_player)[1]
-                if new_score > value:
-                    value = new_score
-                    col = c
-                alpha = max(alpha, value)
-                if alpha >= beta:
-                    break
-            return col, value
-        else:  # minimizing player
-            value = math.inf
-            col = random.choice(valid_locations)
-            for c in valid_locations:
-                r = self.get_next_open_row(c)
-                b_copy = Board(self.num_of_columns, self.num_of_rows, self.num_to_connect)
-                b_copy.board = self.board.copy()
-                b_copy.drop_piece(r, c, opposing_player)
-                new_score = b_copy.minimax(depth - 1, alpha, beta, True, r, c, current_player, opposing_player)[1]
-                if new_score < value:
-                    value = new_score
-                    col = c
-                beta = min(beta, value)
-                if alpha >= beta:
-                    break
-            return col, value
-
-    def get_valid_locations(self):
-        valid_locations = []
-        for c in range(self.num_of_columns):
-            if self.is_valid_move(c):
-                valid_locations.append(c)
-        return valid_locations
-
-    def pick_best_move(self, current_player, opposing_player):
-        valid_locations = self.get_valid_locations()
-        best_score = 0
-        best_column = random.choice(valid_locations)
-        for c in valid_locations:
-            r = self.get_next_open_row(c)
-            temp_board = Board(self.num_of_columns, self.num_of_rows, self.num_to_connect)
-            temp_board.board = self.board.copy()
-            print(temp_board.board)
-            temp_board.board[r][c] = current_player.piece
-            score = temp_board.score_position(c, r, current_player, opposing_player)
-            if score > best_score:
-                best_score = score
-                best_column = c
-        return best_column
-
-
-class Player:
-    def __init__(self, name, piece, is_a_computer):
-        self.name = name
-        self.piece = piece
-        self.is_a_computer = is_a_computer
+def get_display(size):
+    # the menu and every game share the one display surface, the window is only resized when the size changes
+    load_pygame()
+    screen = pygame.display.get_surface()
+    if screen is None or screen.get_size() != size:
+        screen = pygame.display.set_mode(size)
+    return screen
 
 
 class Game:
@@ -214,41 +53,88 @@ class Game:
         self.width = self.board.num_of_columns * self.square_size
         self.height = (self.board.num_of_rows + 1) * self.square_size
         self.size = (self.width, self.height)
-        self.screen = pygame.display.set_mode(self.size)
+        self.screen = None  # the window and what is drawn on it are only set up by start
         self.blue = (47, 141, 255)
         self.black = (0, 0, 0)
         self.red = (255, 0, 0)
         self.yellow = (255, 255, 0)
         self.green = (0, 255, 0)
-        self.winner_font = pygame.font.SysFont("Arial Rounded MT Bold", 100)
-
-    def draw_board(self):
+        self.ai_time_budget_ms = 1000  # how long a computer player may think about a move
+        self.ai_move_delay_ms = 500  # shortest time before a computer move is shown, so it can be followed
+        self.use_opening_book = True  # play book moves instantly when the board size has an opening book
+        # with more than one worker the computer searches its moves on that many processes
+        self.ai_workers = game_options['ai_workers']
+        self.parallel_search = None
+        self.monte_carlo_searches = {}  # the MonteCarloSearch of every 'mcts' player, its tree is kept between moves
+        self.solver = None  # the Solver of the 'solver' players, its table is kept between moves
+        self.print_boards = game_options['print_boards']  # print the board to the console after every move
+        self.show_search_stats = game_options['show_search_stats']  # print what every computer search did
+        self.profile_search = game_options['profile_search']  # print the hottest functions of every computer search
+        self.search_stats = None
+        # the computer searches in a background thread so the window keeps responding while it thinks
+        self.search_thread = None
+        self.search_result = None
+        self.search_progress = None
+        self.search_started = 0
+        self.cancel_search = threading.Event()
+        self.frame_rate = 30
+        # scene state, see SceneManager
+        self.waits_for_events = False
+        self.current_player = None
+        self.opposing_player = None
+        self.game_over = False
+        self.tie = False
+        self.end_time = 0
+        self.done = False
+        self.info_font = None
+        self.winner_font = None
+        self.grid_surface = None
+        self.top_strip = None
+
+    def render_grid(self):
+        grid_surface = pygame.Surface((self.width, self.height - self.square_size))
+        grid_surface.fill(self.blue)
         for c in range(self.board.num_of_columns):
             for r in range(self.board.num_of_rows):
-                pygame.draw.rect(self.screen, self.blue,
-                                 (c * self.square_size, r * self.square_size + self.square_size,
-                                  self.square_size, self.square_size))
-                pygame.draw.circle(self.screen, self.black,
+                pygame.draw.circle(grid_surface, self.black,
                                    (int(c * self.square_size + self.square_size / 2),
-                                    int(r * self.square_size + self.square_size + self.square_size / 2)),
+                                    int(r * self.square_size + self.square_size / 2)),
                                    self.radius)
+        return grid_surface
+
+    def cell_rect(self, row, column):
+        # the square of the screen a cell is drawn in, row 0 is the bottom row
+        return pygame.Rect(column * self.square_size, self.height - (row + 1) * self.square_size,
+                           self.square_size, self.square_size)
+
+    def draw_piece(self, row, column):
+        # draws the piece in one cell and returns the part of the screen that changed
+        rect = self.cell_rect(row, column)
+        piece = self.board.piece_at(row, column)
+        if piece == 1:
+            pygame.draw.circle(self.screen, self.red, rect.center, self.radius)
+        elif piece == 2:
+            pygame.draw.circle(self.screen, self.yellow, rect.center, self.radius)
+        return rect
+
+    def draw_board(self):
+        # redraws the whole board, only needed when the game starts. After that draw_move only draws what changed
+        self.screen.blit(self.grid_surface, (0, self.square_size))
         for c in range(self.board.num_of_columns):
-            for r in range(self.board.num_of_rows):
-                if self.board.board[r][c] == 1:
-                    pygame.draw.circle(self.screen, self.red,
-                                       (int(c * self.square_size + self.square_size / 2),
-                                        self.height - int(r * self.square_size + self.square_size / 2)),
-                                       self.radius)
-                elif self.board.board[r][c] == 2:
-                    pygame.draw.circle(self.screen, self.yellow,
-                                       (int(c * self.square_size + self.square_size / 2),
-                                        self.height - int(r * self.square_size + self.square_size / 2)),
-                                       self.radius)
+            for r in range(self.board.heights[c]):
+                self.draw_piece(r, c)
         pygame.display.update()
 
+    def draw_move(self, column):
+        # draws the piece that was just dropped in column and clears the strip above the board
+        pygame.draw.rect(self.screen, self.black, self.top_strip)
+        rect = self.draw_piece(self.board.heights[column] - 1, column)
+        pygame.display.update([self.top_strip, rect])
+
     def print_board(self):
         # prints the board to the command line
-        print(np.flipud(self.board.board))
+        if self.print_boards:
+            print(self.board.board[::-1])
 
     def process_response(self, column, current_player):
         # places the piece on the board and returns true if the player won the game with that move
@@ -260,84 +146,234 @@ class Game:
         # returns the player that is not the current player
         return self.player1 if current_player is self.player2 else self.player2
 
-    def play_game(self):
+    def start_search(self, current_player, opposing_player):
+        # searches a copy of the board so the pieces the search tries are never drawn
+        self.search_result = None
+        self.search_progress = None
+        self.search_started = pygame.time.get_ticks()
+        self.cancel_search.clear()
+        board_copy = self.board.copy()
+        board_copy.stop_event = self.cancel_search
+        self.search_thread = threading.Thread(target=self.run_search,
+                                              args=(board_copy, current_player, opposing_player), daemon=True)
+        self.search_thread.start()
+
+    def run_search(self, board, current_player, opposing_player):
+        try:
+            if self.profile_search:
+                profile_call(self.search_move, board, current_player, opposing_player)
+            else:
+                self.search_move(board, current_player, opposing_player)
+        except Exception as error:
+            # the game still needs a move when the search fails, e.g. on a broken opening book file
+            print(f"{current_player.name}: the search failed ({error!r}), searching without the book",
+                  file=sys.stderr)
+            self.search_result = self.fallback_move(current_player, opposing_player)
+
+    def fallback_move(self, current_player, opposing_player):
+        # a plain search on a new copy of the board, the failed search may have left pieces on its copy. If that fails
+        # too, any valid column
+        try:
+            board_copy = self.board.copy()
+            board_copy.stop_event = self.cancel_search
+            return board_copy.iterative_deepening(current_player, opposing_player, self.ai_time_budget_ms)
+        except Exception as error:
+            print(f"{current_player.name}: the search failed again ({error!r}), playing a random move",
+                  file=sys.stderr)
+            return random.choice(self.board.get_valid_locations()), 0, 0
+
+    def search_move(self, board, current_player, opposing_player):
+        self.search_stats = None
+        if current_player.engine == 'mcts':
+            if current_player.piece not in self.monte_carlo_searches:
+                self.monte_carlo_searches[current_player.piece] = MonteCarloSearch(
+                    board.num_of_columns, board.num_of_rows, board.num_to_connect, workers=self.ai_workers)
+            self.search_result = self.monte_carlo_searches[current_player.piece].search(
+                board, current_player, opposing_player, self.ai_time_budget_ms)
+            return
+        time_budget_ms = self.ai_time_budget_ms
+        if current_player.engine == 'solver':
+            # the solver gets half of the time, a position it can't solve in that time is searched with the rest
+            if self.solver is None:
+                self.solver = Solver(board.num_of_columns, board.num_of_rows, board.num_to_connect)
+                self.solver.stop_event = self.cancel_search
+            try:
+                column, score = self.solver.best_move(board, current_player, time_budget_ms / 2)
+                self.search_result = (column, score, 0)
+                return
+            except SearchTimeout:
+                time_budget_ms -= self.solver.elapsed_time * 1000
+        if self.use_opening_book:
+            book = get_opening_book(board.num_of_columns, board.num_of_rows, board.num_to_connect)
+            column = book.lookup(board, current_player) if book is not None else None
+            if column is not None and board.is_valid_move(column):
+                self.search_result = (column, 0, 0)
+                return
+        if self.ai_workers > 1:
+            if self.parallel_search is None:
+                self.parallel_search = ParallelSearch(self.ai_workers)
+            self.search_result = self.parallel_search.search(board, current_player, opposing_player,
+                                                             time_budget_ms=time_budget_ms)
+            self.search_stats = self.parallel_search.search_stats
+        else:
+            self.search_result = board.iterative_deepening(current_player, opposing_player, time_budget_ms,
+                                                           progress_callback=self.report_progress)
+            self.search_stats = board.search_stats
+
+    def report_progress(self, depth, column, score):
+        # called from the search thread after every finished iteration
+        self.search_progress = (depth, column)
+
+    def stop_search(self):
+        # the worker processes of a parallel search can't be interrupted, they finish within the time budget
+        self.cancel_search.set()
+        if self.ai_workers > 1:
+            if self.parallel_search is not None:
+                self.parallel_search.close(wait=False)
+            for monte_carlo_search in self.monte_carlo_searches.values():
+                monte_carlo_search.close(wait=False)
+        elif self.search_thread is not None:
+            self.search_thread.join()
+        self.search_thread = None
+
+    def draw_search_progress(self, current_player):
+        # shows the best move found so far above its column and how deep the search got
+        pygame.draw.rect(self.screen, self.black, self.top_strip)
+        color = self.red if current_player is self.player1 else self.yellow
+        if self.search_progress is not None:
+            depth, column = self.search_progress
+            pygame.draw.circle(self.screen, color,
+                               (int(column * self.square_size + self.square_size / 2), int(self.square_size / 2)),
+                               self.radius, 3)
+            text = f"{current_player.name} is thinking... depth {depth}"
+        else:
+            text = f"{current_player.name} is thinking..."
+        label = self.info_font.render(text, 1, color)
+        self.screen.blit(label, (5, 5))
+        pygame.display.update(self.top_strip)
+
+    def start(self):
+        self.screen = get_display(self.size)
+        self.info_font = get_font("Verdana", 16)
+        self.winner_font = get_font("Arial Rounded MT Bold", 100)
+        # the blue grid with its empty holes never changes, it is drawn once and copied to the screen when needed
+        self.grid_surface = self.render_grid()
+        self.top_strip = pygame.Rect(0, 0, self.width, self.square_size)
         self.draw_board()
-        pygame.display.update()
-        current_player = random.choice([self.player1, self.player2]) # randomly select who gets first move
-        opposing_player = self.player1 if current_player is self.player2 else self.player2
-        game_over = False
-        tie = False
-        while not game_over:
-            # Computer makes a move
-            pygame.draw.rect(self.screen, self.black, (0, 0, self.width, self.square_size))
-            if current_player.is_a_computer:
-                column, minimax_score = self.board.minimax(4, -math.inf, math.inf, True, 0, 0, current_player,
-                                                           opposing_player)
+        self.current_player = random.choice([self.player1, self.player2])  # randomly select who gets first move
+        self.opposing_player = self.change_player(self.current_player)
+
+    def handle_event(self, event):
+        # Human makes a move
+        if self.current_player.is_a_computer or self.game_over:
+            return
+
+        if event.type == pygame.MOUSEMOTION:
+            pygame.draw.rect(self.screen, self.black, self.top_strip)
+            pos_x = event.pos[0]
+            if self.current_player is self.player1:
+                pygame.draw.circle(self.screen, self.red, (pos_x, int(self.square_size / 2)), self.radius)
+            else:
+                pygame.draw.circle(self.screen, self.yellow, (pos_x, int(self.square_size / 2)), self.radius)
+            pygame.display.update(self.top_strip)
+
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            pos_x = event.pos[0]
+            column = int(math.floor(pos_x / self.square_size))
+            if self.board.is_valid_move(column):
+                self.play_move(column)
+
+    def update(self):
+        # called every frame, the computer moves and the result is shown for 10 seconds before the game is done
+        if self.game_over:
+            self.done = pygame.time.get_ticks() >= self.end_time
+        # Computer makes a move
+        elif self.current_player.is_a_computer:
+            if self.search_thread is None:
+                self.start_search(self.current_player, self.opposing_player)
+            elif (not self.search_thread.is_alive()
+                  and pygame.time.get_ticks() - self.search_started >= self.ai_move_delay_ms):
+                self.search_thread = None
+                column = self.search_result[0]
+                if self.show_search_stats and self.search_stats is not None:
+                    print(f"{self.current_player.name}: {self.search_stats}")
                 if self.board.is_valid_move(column):
-                    pygame.time.wait(500)
-                    game_over = self.process_response(column, current_player)
-                    if len(self.board.get_valid_locations()) == 0:  # true when all spaces are taken
-                        tie = True
-                        game_over = True
-                    self.print_board()
-                    self.draw_board()
-                    if not game_over:
-                        current_player = self.change_player(current_player)
-                        opposing_player = self.change_player(opposing_player)
-
-            # Human makes a move
+                    self.play_move(column)
             else:
-                pygame.draw.rect(self.screen, self.black, (0, 0, self.width, self.square_size))
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        sys.exit()
-
-                    if event.type == pygame.MOUSEMOTION:
-                        pygame.draw.rect(self.screen, self.black, (0, 0, self.width, self.square_size))
-                        pos_x = event.pos[0]
-                        if current_player is self.player1:
-                            pygame.draw.circle(self.screen, self.red, (pos_x, int(self.square_size / 2)), self.radius)
-                        else:
-                            pygame.draw.circle(self.screen, self.yellow, (pos_x, int(self.square_size / 2)),
-                                               self.radius)
-                        pygame.display.update()
-
-                    if event.type == pygame.MOUSEBUTTONDOWN:
-                        pos_x = event.pos[0]
-                        column = int(math.floor(pos_x / self.square_size))
-                        if self.board.is_valid_move(column):
-                            game_over = self.process_response(column, current_player)
-                            if len(self.board.get_valid_locations()) == 0:  # true when all spaces are taken
-                                tie = True
-                                game_over = True
-                            self.print_board()
-                            self.draw_board()
-                            if not game_over:
-                                current_player = self.change_player(current_player)
-                                opposing_player = self.change_player(opposing_player)
-
-        pygame.draw.rect(self.screen, self.black, (0, 0, self.width, self.square_size))
-
-        if not tie:
-            winner_color = self.red if current_player is self.player1 else self.yellow
-            winner_label = self.winner_font.render(f"{current_player.name} wins!", 1, winner_color)
+                self.draw_search_progress(self.current_player)
+
+    def play_move(self, column):
+        self.game_over = self.process_response(column, self.current_player)
+        if len(self.board.get_valid_locations()) == 0:  # true when all spaces are taken
+            self.tie = True
+            self.game_over = True
+        self.print_board()
+        self.draw_move(column)
+        if self.game_over:
+            self.show_result()
+        else:
+            self.current_player = self.change_player(self.current_player)
+            self.opposing_player = self.change_player(self.opposing_player)
+
+    def show_result(self):
+        pygame.draw.rect(self.screen, self.black, self.top_strip)
+
+        if not self.tie:
+            winner_color = self.red if self.current_player is self.player1 else self.yellow
+            winner_label = self.winner_font.render(f"{self.current_player.name} wins!", 1, winner_color)
         else:
             winner_label = self.winner_font.render(f"Draw!", 1, self.green)
         winner_rect = winner_label.get_rect(center=(self.width / 2, 40))
         self.screen.blit(winner_label, winner_rect)
-        pygame.display.update()
-        pygame.time.wait(10000)
-        return_to_menu = MainMenu()
-        return_to_menu.run()
+        pygame.display.update(self.top_strip.union(winner_rect))
+        if self.parallel_search is not None:
+            self.parallel_search.close()
+        for monte_carlo_search in self.monte_carlo_searches.values():
+            monte_carlo_search.close()
+        self.end_time = pygame.time.get_ticks() + 10000
+
+    def close(self):
+        self.stop_search()
+
+
+class SceneManager:
+    # one loop runs the menu and the games. The scene that is showing handles the events and is updated every frame
+    # until it is done, then the menu starts a game or a finished game goes back to the menu. The menu only changes
+    # when it gets an event, so while it is showing the loop sleeps until there is one
+    def __init__(self):
+        load_pygame()
+        self.menu = MainMenu()
+        self.scene = self.menu
+        self.clock = pygame.time.Clock()
+
+    def run(self):
+        self.scene.start()
+        while True:
+            if self.scene.waits_for_events:
+                events = [pygame.event.wait()] + pygame.event.get()
+            else:
+                events = pygame.event.get()
+            for event in events:
+                if event.type == pygame.QUIT:
+                    self.scene.close()
+                    sys.exit()
+                self.scene.handle_event(event)
+                if self.scene.done:
+                    break
+            self.scene.update()
+            if self.scene.done:
+                self.scene = self.menu.create_game() if self.scene is self.menu else self.menu
+                self.scene.start()
+            self.clock.tick(self.scene.frame_rate)
 
 
 class MainMenu:
     def __init__(self):
         # screen
-        self.width = 500
+        self.width = 540
         self.height = 500
         self.size = (self.width, self.height)
-        self.screen = pygame.display.set_mode(self.size)
+        self.screen = get_display(self.size)
         pygame.display.set_caption('Connect')
         # color and fonts
         self.white = (255, 255, 255)
@@ -345,8 +381,21 @@ class MainMenu:
         self.yellow = (255, 255, 0)
         self.blue = (0, 0, 255)
         self.green = (0, 255, 0)
-        self.title_font = pygame.font.SysFont("Arial Rounded MT Bold", 120)
-        self.option_font = pygame.font.SysFont("Verdana", 30)
+        self.title_font = get_font("Arial Rounded MT Bold", 120)
+        self.option_font = get_font("Verdana", 30)
+        self.frame_rate = 30
+        # scene state, see SceneManager
+        self.waits_for_events = True
+        self.redraw = True
+        self.done = False
+        # the title and labels never change, they are rendered once
+        title = self.title_font.render("Connect!", 1, (255, 255, 255))
+        self.labels = [(title, title.get_rect(center=(self.width / 2, 60))),
+                       (self.option_font.render("Red:", 1, (255, 0, 0)), (30, self.height / 4)),
+                       (self.option_font.render("Yellow:", 1, (255, 255, 0)), (30, self.height / 4 + 50)),
+                       (self.option_font.render("Cols:", 1, (0, 0, 255)), (30, self.height / 4 + 100)),
+                       (self.option_font.render("Rows:", 1, (0, 0, 255)), (30, self.height / 4 + 150)),
+                       (self.option_font.render("Win:", 1, (0, 0, 255)), (30, self.height / 4 + 200))]
         # number of columns buttons
         self.col_6_button = Button(self.white, 150, self.height / 4 + 100, 50, 40, "6")
         self.col_7_button = Button(self.green, 210, self.height / 4 + 100, 50, 40, "7")
@@ -366,9 +415,13 @@ class MainMenu:
         self.win_6_button = Button(self.white, 330, self.height / 4 + 200, 50, 40, "6")
         # human or computer buttons
         self.p1_human_button = Button(self.green, 150, self.height / 4, 120, 40, "Human")
-        self.p1_computer_button = Button(self.white, 280, self.height / 4, 120, 40, "AI")
+        self.p1_computer_button = Button(self.white, 280, self.height / 4, 60, 40, "AI")
+        self.p1_mcts_button = Button(self.white, 350, self.height / 4, 60, 40, "MC")
+        self.p1_solver_button = Button(self.white, 420, self.height / 4, 100, 40, "Solve")
         self.p2_human_button = Button(self.white, 150, self.height / 4 + 50, 120, 40, "Human")
-        self.p2_computer_button = Button(self.green, 280, self.height / 4 + 50, 120, 40, "AI")
+        self.p2_computer_button = Button(self.green, 280, self.height / 4 + 50, 60, 40, "AI")
+        self.p2_mcts_button = Button(self.white, 350, self.height / 4 + 50, 60, 40, "MC")
+        self.p2_solver_button = Button(self.white, 420, self.height / 4 + 50, 100, 40, "Solve")
         # play button
         self.play_button = Button(self.green, self.width / 2 - 40, self.height - 90, 80, 50, "Play")
         # board and player settings
@@ -377,41 +430,37 @@ class MainMenu:
         self.num_to_connect = 4
         self.p1_is_a_computer = False
         self.p2_is_a_computer = True
+        # 'minimax' for the AI buttons, 'mcts' for the MC (Monte Carlo) buttons and 'solver' for the Solve buttons
+        self.p1_engine = 'minimax'
+        self.p2_engine = 'minimax'
 
     def draw_menu(self):
-        # draw title
-        title = self.title_font.render("Connect!", 1, (255, 255, 255))
-        title_rect = title.get_rect(center=(self.width / 2, 60))
-        self.screen.blit(title, title_rect)
+        # draw title and labels
+        for label, position in self.labels:
+            self.screen.blit(label, position)
         # draw red player options
-        player1_label = self.option_font.render("Red:", 1, (255, 0, 0))
-        self.screen.blit(player1_label, (30, self.height / 4))
         self.p1_human_button.draw(self.screen, True)
         self.p1_computer_button.draw(self.screen, True)
+        self.p1_mcts_button.draw(self.screen, True)
+        self.p1_solver_button.draw(self.screen, True)
         # draw yellow player options
-        player2_label = self.option_font.render("Yellow:", 1, (255, 255, 0))
-        self.screen.blit(player2_label, (30, self.height / 4 + 50))
         self.p2_human_button.draw(self.screen, True)
         self.p2_computer_button.draw(self.screen, True)
+        self.p2_mcts_button.draw(self.screen, True)
+        self.p2_solver_button.draw(self.screen, True)
         # draw column options
-        columns_label = self.option_font.render("Cols:", 1, (0, 0, 255))
-        self.screen.blit(columns_label, (30, self.height / 4 + 100))
         self.col_6_button.draw(self.screen, True)
         self.col_7_button.draw(self.screen, True)
         self.col_8_button.draw(self.screen, True)
         self.col_9_button.draw(self.screen, True)
         self.col_10_button.draw(self.screen, True)
         # draw row options
-        rows_label = self.option_font.render("Rows:", 1, (0, 0, 255))
-        self.screen.blit(rows_label, (30, self.height / 4 + 150))
         self.row_6_button.draw(self.screen, True)
         self.row_7_button.draw(self.screen, True)
         self.row_8_button.draw(self.screen, True)
         self.row_9_button.draw(self.screen, True)
         self.row_10_button.draw(self.screen, True)
         # draw num to win options
-        connect_label = self.option_font.render("Win:", 1, (0, 0, 255))
-        self.screen.blit(connect_label, (30, self.height / 4 + 200))
         self.win_3_button.draw(self.screen, True)
         self.win_4_button.draw(self.screen, True)
         self.win_5_button.draw(self.screen, True)
@@ -420,137 +469,190 @@ class MainMenu:
         self.play_button.draw(self.screen, True)
         pygame.display.update()
 
-    def run(self):
-        running = True
-        while running:
+    def start(self):
+        # shows the menu again with the settings of the last game still selected
+        self.screen = get_display(self.size)
+        self.screen.fill((0, 0, 0))
+        self.redraw = True
+        self.done = False
+
+    def handle_event(self, event):
+        if event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+            self.redraw = True
+
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            self.redraw = True
+            # click play button
+            if self.play_button.is_over(event.pos):
+                self.done = True
+            # click player 1 human/computer buttons
+            elif self.p1_human_button.is_over(event.pos):
+                self.p1_is_a_computer = False
+                self.p1_human_button.set_color((0, 255, 0))
+                self.p1_computer_button.set_color(self.white)
+                self.p1_mcts_button.set_color(self.white)
+                self.p1_solver_button.set_color(self.white)
+            elif self.p1_computer_button.is_over(event.pos):
+                self.p1_is_a_computer = True
+                self.p1_engine = 'minimax'
+                self.p1_computer_button.set_color((0, 255, 0))
+                self.p1_human_button.set_color(self.white)
+                self.p1_mcts_button.set_color(self.white)
+                self.p1_solver_button.set_color(self.white)
+            elif self.p1_mcts_button.is_over(event.pos):
+                self.p1_is_a_computer = True
+                self.p1_engine = 'mcts'
+                self.p1_mcts_button.set_color((0, 255, 0))
+                self.p1_human_button.set_color(self.white)
+                self.p1_computer_button.set_color(self.white)
+                self.p1_solver_button.set_color(self.white)
+            elif self.p1_solver_button.is_over(event.pos):
+                self.p1_is_a_computer = True
+                self.p1_engine = 'solver'
+                self.p1_solver_button.set_color((0, 255, 0))
+                self.p1_human_button.set_color(self.white)
+                self.p1_computer_button.set_color(self.white)
+                self.p1_mcts_button.set_color(self.white)
+            # click player 2 human/computer buttons
+            elif self.p2_human_button.is_over(event.pos):
+                self.p2_is_a_computer = False
+                self.p2_human_button.set_color((0, 255, 0))
+                self.p2_computer_button.set_color(self.white)
+                self.p2_mcts_button.set_color(self.white)
+                self.p2_solver_button.set_color(self.white)
+            elif self.p2_computer_button.is_over(event.pos):
+                self.p2_is_a_computer = True
+                self.p2_engine = 'minimax'
+                self.p2_computer_button.set_color((0, 255, 0))
+                self.p2_human_button.set_color(self.white)
+                self.p2_mcts_button.set_color(self.white)
+                self.p2_solver_button.set_color(self.white)
+            elif self.p2_mcts_button.is_over(event.pos):
+                self.p2_is_a_computer = True
+                self.p2_engine = 'mcts'
+                self.p2_mcts_button.set_color((0, 255, 0))
+                self.p2_human_button.set_color(self.white)
+                self.p2_computer_button.set_color(self.white)
+                self.p2_solver_button.set_color(self.white)
+            elif self.p2_solver_button.is_over(event.pos):
+                self.p2_is_a_computer = True
+                self.p2_engine = 'solver'
+                self.p2_solver_button.set_color((0, 255, 0))
+                self.p2_human_button.set_color(self.white)
+                self.p2_computer_button.set_color(self.white)
+                self.p2_mcts_button.set_color(self.white)
+            # click columns buttons
+            elif self.col_6_button.is_over(event.pos):
+                self.num_of_columns = 6
+                self.col_6_button.set_color(self.green)
+                self.col_7_button.set_color(self.white)
+                self.col_8_button.set_color(self.white)
+                self.col_9_button.set_color(self.white)
+                self.col_10_button.set_color(self.white)
+            elif self.col_7_button.is_over(event.pos):
+                self.num_of_columns = 7
+                self.col_6_button.set_color(self.white)
+                self.col_7_button.set_color(self.green)
+                self.col_8_button.set_color(self.white)
+                self.col_9_button.set_color(self.white)
+                self.col_10_button.set_color(self.white)
+            elif self.col_8_button.is_over(event.pos):
+                self.num_of_columns = 8
+                self.col_6_button.set_color(self.white)
+                self.col_7_button.set_color(self.white)
+                self.col_8_button.set_color(self.green)
+                self.col_9_button.set_color(self.white)
+                self.col_10_button.set_color(self.white)
+            elif self.col_9_button.is_over(event.pos):
+                self.num_of_columns = 9
+                self.col_6_button.set_color(self.white)
+                self.col_7_button.set_color(self.white)
+                self.col_8_button.set_color(self.white)
+                self.col_9_button.set_color(self.green)
+                self.col_10_button.set_color(self.white)
+            elif self.col_10_button.is_over(event.pos):
+                self.num_of_columns = 10
+                self.col_6_button.set_color(self.white)
+                self.col_7_button.set_color(self.white)
+                self.col_8_button.set_color(self.white)
+                self.col_9_button.set_color(self.white)
+                self.col_10_button.set_color(self.green)
+            # click rows buttons
+            elif self.row_6_button.is_over(event.pos):
+                self.num_of_rows = 6
+                self.row_6_button.set_color(self.green)
+                self.row_7_button.set_color(self.white)
+                self.row_8_button.set_color(self.white)
+                self.row_9_button.set_color(self.white)
+                self.row_10_button.set_color(self.white)
+            elif self.row_7_button.is_over(event.pos):
+                self.num_of_rows = 7
+                self.row_6_button.set_color(self.white)
+                self.row_7_button.set_color(self.green)
+                self.row_8_button.set_color(self.white)
+                self.row_9_button.set_color(self.white)
+                self.row_10_button.set_color(self.white)
+            elif self.row_8_button.is_over(event.pos):
+                self.num_of_rows = 8
+                self.row_6_button.set_color(self.white)
+                self.row_7_button.set_color(self.white)
+                self.row_8_button.set_color(self.green)
+                self.row_9_button.set_color(self.white)
+                self.row_10_button.set_color(self.white)
+            elif self.row_9_button.is_over(event.pos):
+                self.num_of_rows = 9
+                self.row_6_button.set_color(self.white)
+                self.row_7_button.set_color(self.white)
+                self.row_8_button.set_color(self.white)
+                self.row_9_button.set_color(self.green)
+                self.row_10_button.set_color(self.white)
+            elif self.row_10_button.is_over(event.pos):
+                self.num_of_rows = 10
+                self.row_6_button.set_color(self.white)
+                self.row_7_button.set_color(self.white)
+                self.row_8_button.set_color(self.white)
+                self.row_9_button.set_color(self.white)
+                self.row_10_button.set_color(self.green)
+            # click num to win buttons
+            elif self.win_3_button.is_over(event.pos):
+                self.num_to_connect = 3
+                self.win_3_button.set_color(self.green)
+                self.win_4_button.set_color(self.white)
+                self.win_5_button.set_color(self.white)
+                self.win_6_button.set_color(self.white)
+            elif self.win_4_button.is_over(event.pos):
+                self.num_to_connect = 4
+                self.win_3_button.set_color(self.white)
+                self.win_4_button.set_color(self.green)
+                self.win_5_button.set_color(self.white)
+                self.win_6_button.set_color(self.white)
+            elif self.win_5_button.is_over(event.pos):
+                self.num_to_connect = 5
+                self.win_3_button.set_color(self.white)
+                self.win_4_button.set_color(self.white)
+                self.win_5_button.set_color(self.green)
+                self.win_6_button.set_color(self.white)
+            elif self.win_6_button.is_over(event.pos):
+                self.num_to_connect = 6
+                self.win_3_button.set_color(self.white)
+                self.win_4_button.set_color(self.white)
+                self.win_5_button.set_color(self.white)
+                self.win_6_button.set_color(self.green)
+
+    def update(self):
+        if self.redraw:
             self.draw_menu()
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    sys.exit()
+            self.redraw = False
+
+    def close(self):
+        pass
 
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    # click play button
-                    if self.play_button.is_over(event.pos):
-                        b = Board(self.num_of_columns, self.num_of_rows, self.num_to_connect)
-                        p1 = Player('Red', 1, self.p1_is_a_computer)
-                        p2 = Player('Yellow', 2, self.p2_is_a_computer)
-                        g = Game(b, p1, p2)
-                        g.play_game()
-                    # click player 1 human/computer buttons
-                    elif self.p1_human_button.is_over(event.pos):
-                        self.p1_is_a_computer = False
-                        self.p1_human_button.set_color((0, 255, 0))
-                        self.p1_computer_button.set_color(self.white)
-                    elif self.p1_computer_button.is_over(event.pos):
-                        self.p1_is_a_computer = True
-                        self.p1_computer_button.set_color((0, 255, 0))
-                        self.p1_human_button.set_color(self.white)
-                    # click player 2 human/computer buttons
-                    elif self.p2_human_button.is_over(event.pos):
-                        self.p2_is_a_computer = False
-                        self.p2_human_button.set_color((0, 255, 0))
-                        self.p2_computer_button.set_color(self.white)
-                    elif self.p2_computer_button.is_over(event.pos):
-                        self.p2_is_a_computer = True
-                        self.p2_computer_button.set_color((0, 255, 0))
-                        self.p2_human_button.set_color(self.white)
-                    # click columns buttons
-                    elif self.col_6_button.is_over(event.pos):
-                        self.num_of_columns = 6
-                        self.col_6_button.set_color(self.green)
-                        self.col_7_button.set_color(self.white)
-                        self.col_8_button.set_color(self.white)
-                        self.col_9_button.set_color(self.white)
-                        self.col_10_button.set_color(self.white)
-                    elif self.col_7_button.is_over(event.pos):
-                        self.num_of_columns = 7
-                        self.col_6_button.set_color(self.white)
-                        self.col_7_button.set_color(self.green)
-                        self.col_8_button.set_color(self.white)
-                        self.col_9_button.set_color(self.white)
-                        self.col_10_button.set_color(self.white)
-                    elif self.col_8_button.is_over(event.pos):
-                        self.num_of_columns = 8
-                        self.col_6_button.set_color(self.white)
-                        self.col_7_button.set_color(self.white)
-                        self.col_8_button.set_color(self.green)
-                        self.col_9_button.set_color(self.white)
-                        self.col_10_button.set_color(self.white)
-                    elif self.col_9_button.is_over(event.pos):
-                        self.num_of_columns = 9
-                        self.col_6_button.set_color(self.white)
-                        self.col_7_button.set_color(self.white)
-                        self.col_8_button.set_color(self.white)
-                        self.col_9_button.set_color(self.green)
-                        self.col_10_button.set_color(self.white)
-                    elif self.col_10_button.is_over(event.pos):
-                        self.num_of_columns = 10
-                        self.col_6_button.set_color(self.white)
-                        self.col_7_button.set_color(self.white)
-                        self.col_8_button.set_color(self.white)
-                        self.col_9_button.set_color(self.white)
-                        self.col_10_button.set_color(self.green)
-                    # click rows buttons
-                    elif self.row_6_button.is_over(event.pos):
-                        self.num_of_rows = 6
-                        self.row_6_button.set_color(self.green)
-                        self.row_7_button.set_color(self.white)
-                        self.row_8_button.set_color(self.white)
-                        self.row_9_button.set_color(self.white)
-                        self.row_10_button.set_color(self.white)
-                    elif self.row_7_button.is_over(event.pos):
-                        self.num_of_rows = 7
-                        self.row_6_button.set_color(self.white)
-                        self.row_7_button.set_color(self.green)
-                        self.row_8_button.set_color(self.white)
-                        self.row_9_button.set_color(self.white)
-                        self.row_10_button.set_color(self.white)
-                    elif self.row_8_button.is_over(event.pos):
-                        self.num_of_rows = 8
-                        self.row_6_button.set_color(self.white)
-                        self.row_7_button.set_color(self.white)
-                        self.row_8_button.set_color(self.green)
-                        self.row_9_button.set_color(self.white)
-                        self.row_10_button.set_color(self.white)
-                    elif self.row_9_button.is_over(event.pos):
-                        self.num_of_rows = 9
-                        self.row_6_button.set_color(self.white)
-                        self.row_7_button.set_color(self.white)
-                        self.row_8_button.set_color(self.white)
-                        self.row_9_button.set_color(self.green)
-                        self.row_10_button.set_color(self.white)
-                    elif self.row_10_button.is_over(event.pos):
-                        self.num_of_rows = 10
-                        self.row_6_button.set_color(self.white)
-                        self.row_7_button.set_color(self.white)
-                        self.row_8_button.set_color(self.white)
-                        self.row_9_button.set_color(self.white)
-                        self.row_10_button.set_color(self.green)
-                    # click num to win buttons
-                    elif self.win_3_button.is_over(event.pos):
-                        self.num_to_connect = 3
-                        self.win_3_button.set_color(self.green)
-                        self.win_4_button.set_color(self.white)
-                        self.win_5_button.set_color(self.white)
-                        self.win_6_button.set_color(self.white)
-                    elif self.win_4_button.is_over(event.pos):
-                        self.num_to_connect = 4
-                        self.win_3_button.set_color(self.white)
-                        self.win_4_button.set_color(self.green)
-                        self.win_5_button.set_color(self.white)
-                        self.win_6_button.set_color(self.white)
-                    elif self.win_5_button.is_over(event.pos):
-                        self.num_to_connect = 5
-                        self.win_3_button.set_color(self.white)
-                        self.win_4_button.set_color(self.white)
-                        self.win_5_button.set_color(self.green)
-                        self.win_6_button.set_color(self.white)
-                    elif self.win_6_button.is_over(event.pos):
-                        self.num_to_connect = 6
-                        self.win_3_button.set_color(self.white)
-                        self.win_4_button.set_color(self.white)
-                        self.win_5_button.set_color(self.white)
-                        self.win_6_button.set_color(self.green)
+    def create_game(self):
+        # the game with the settings that are selected
+        b = Board(self.num_of_columns, self.num_of_rows, self.num_to_connect)
+        p1 = Player('Red', 1, self.p1_is_a_computer, self.p1_engine)
+        p2 = Player('Yellow', 2, self.p2_is_a_computer, self.p2_engine)
+        return Game(b, p1, p2)
 
 
 class Button:
@@ -561,19 +663,24 @@ class Button:
         self.width = width
         self.height = height
         self.text = text
+        self.surface = None  # the button with its text, rendered the first time it is drawn and when its color changes
+
+    def render(self):
+        surface = pygame.Surface((self.width, self.height))
+        surface.fill(self.color)
+        if self.text != '':
+            text = get_font('Verdana', 30).render(self.text, 1, (0, 0, 0))
+            surface.blit(text, (self.width / 2 - text.get_width() / 2, self.height / 2 - text.get_height() / 2))
+        return surface
 
     def draw(self, win, outline=None):
         # draw the button on the screen
         if outline:
             pygame.draw.rect(win, outline, (self.x - 2, self.y - 2, self.width + 4, self.height + 4), 0)
 
-        pygame.draw.rect(win, self.color, (self.x, self.y, self.width, self.height), 0)
-
-        if self.text != '':
-            font = pygame.font.SysFont('Verdana', 30)
-            text = font.render(self.text, 1, (0, 0, 0))
-            win.blit(text, (
-                self.x + (self.width / 2 - text.get_width() / 2), self.y + (self.height / 2 - text.get_height() / 2)))
+        if self.surface is None:
+            self.surface = self.render()
+        win.blit(self.surface, (self.x, self.y))
 
     def is_over(self, pos):
         # returns true if the mouse position is over the button when called
@@ -584,10 +691,29 @@ class Button:
         return False
 
     def set_color(self, color):
-        self.color = color
+        if color != self.color:
+            self.color = color
+            self.surface = None
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Connect N against a friend or the computer.')
+    parser.add_argument('--quiet', action='store_true', help="don't print the board to the console after every move")
+    parser.add_argument('--stats', action='store_true', help='print what every search of the computer did')
+    parser.add_argument('--profile', action='store_true',
+                        help='profile every search of the computer and print the functions it spent most time in')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes the computer searches its moves on, with more than 1 every search is split '
+                             'between them')
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error('--workers has to be at least 1')
+    game_options['print_boards'] = not args.quiet
+    game_options['show_search_stats'] = args.stats
+    game_options['profile_search'] = args.profile
+    game_options['ai_workers'] = args.workers
 
 
 if __name__ == "__main__":
-    pygame.init()
-    m = MainMenu()
-    m.run()
+    parse_arguments()
+    SceneManager().run()
@@ -0,0 +1,161 @@
+import os
+import sys
+import struct
+import argparse
+from engine import Board, Player
+
+# book files start with this header followed by the entries sorted by key
+BOOK_MAGIC = b'C4BK'
+BOOK_VERSION = 2
+BOOK_HEADER = struct.Struct('<4sBBBBI')  # magic, version, columns, rows, number to connect, entry count
+# numpy dtype of an entry, numpy is only imported once a book is opened or written
+BOOK_ENTRY = [('key', '<u8'), ('move', 'u1'), ('depth', 'u1')]
+BOOK_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'books')
+
+
+class OpeningBook:
+    # best moves of early positions searched deeply ahead of time. The file is memory-mapped and the entries are sorted
+    # by book key, so a lookup is a binary search that only touches a few pages of the file
+    def __init__(self, path):
+        import numpy as np
+        with open(path, 'rb') as book_file:
+            magic, version, num_of_columns, num_of_rows, num_to_connect, num_of_entries = (
+                BOOK_HEADER.unpack(book_file.read(BOOK_HEADER.size)))
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            raise ValueError(f"{path} is not a version {BOOK_VERSION} opening book")
+        self.path = path
+        self.num_of_columns = num_of_columns
+        self.num_of_rows = num_of_rows
+        self.num_to_connect = num_to_connect
+        if num_of_entries:
+            self.entries = np.memmap(path, dtype=BOOK_ENTRY, mode='r', offset=BOOK_HEADER.size,
+                                     shape=(num_of_entries,))
+        else:
+            self.entries = np.zeros(0, dtype=BOOK_ENTRY)
+        self.keys = self.entries['key']
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, board, current_player):
+        # returns the book move for current_player in the position on the board, or None when it is not in the book
+        import numpy as np
+        key = np.uint64(book_key(board, current_player.piece))
+        index = int(np.searchsorted(self.keys, key))
+        if index < len(self.keys) and self.keys[index] == key:
+            move = int(self.entries['move'][index])
+            return board.mirror_column(move) if board.is_mirrored() else move
+        return None
+
+
+loaded_books = {}
+
+
+def book_key(board, piece):
+    # a position and its mirror image share an entry under the canonical hash, with the move stored as played in the
+    # canonical one. Either colour can move first, so with the same number of pieces on the board the hash alone
+    # doesn't say whose turn it is and the piece to move is part of the key
+    return board.canonical_hash() ^ board.perspective_keys[piece]
+
+
+def book_path(num_of_columns, num_of_rows, num_to_connect):
+    return os.path.join(BOOK_DIRECTORY, f"{num_of_columns}x{num_of_rows}x{num_to_connect}.bin")
+
+
+def get_opening_book(num_of_columns, num_of_rows, num_to_connect):
+    # a book is only opened the first time a board of its size asks for it, None if there is no book for that size
+    geometry = (num_of_columns, num_of_rows, num_to_connect)
+    if geometry not in loaded_books:
+        path = book_path(*geometry)
+        loaded_books[geometry] = OpeningBook(path) if os.path.exists(path) else None
+    return loaded_books[geometry]
+
+
+def write_opening_book(path, num_of_columns, num_of_rows, num_to_connect, book_moves):
+    # book_moves maps book keys to (move, depth)
+    import numpy as np
+    entries = np.zeros(len(book_moves), dtype=BOOK_ENTRY)
+    for index, (key, (move, depth)) in enumerate(sorted(book_moves.items())):
+        entries[index] = (key, move, min(depth, 255))
+    with open(path, 'wb') as book_file:
+        book_file.write(BOOK_HEADER.pack(BOOK_MAGIC, BOOK_VERSION, num_of_columns, num_of_rows, num_to_connect,
+                                         len(entries)))
+        book_file.write(entries.tobytes())
+
+
+def search_book_position(geometry, moves, first_piece, time_budget_ms, depth):
+    # runs in a worker process: replays the moves and searches the position they lead to
+    board = Board(*geometry)
+    players = [Player('', first_piece, True), Player('', 3 - first_piece, True)]
+    for ply, column in enumerate(moves):
+        board.drop_piece(board.get_next_open_row(column), column, players[ply % 2])
+    side = len(moves) % 2
+    column, score, depth_reached = board.iterative_deepening(players[side], players[1 - side], time_budget_ms,
+                                                             max_depth=depth)
+    if board.is_mirrored():
+        column = board.mirror_column(column)
+    return book_key(board, players[side].piece), column, depth_reached
+
+
+def generate_opening_book(num_of_columns, num_of_rows, num_to_connect, max_ply, time_budget_ms=None, depth=None,
+                          workers=None):
+    # searches every position that can be reached in at most max_ply moves, with either colour moving first and
+    # counting mirror images once, and returns {book key: (move, depth)} for write_opening_book
+    geometry = (num_of_columns, num_of_rows, num_to_connect)
+    positions = {}
+    for first_piece in (1, 2):
+        board = Board(*geometry)
+        players = [Player('', first_piece, True), Player('', 3 - first_piece, True)]
+        stack = [[]]
+        while stack:
+            moves = stack.pop()
+            for ply, column in enumerate(moves):
+                board.drop_piece(board.get_next_open_row(column), column, players[ply % 2])
+            key = book_key(board, players[len(moves) % 2].piece)
+            if key not in positions:
+                positions[key] = (moves, first_piece)
+                if len(moves) < max_ply:
+                    for column in board.get_valid_locations():
+                        row = board.get_next_open_row(column)
+                        board.drop_piece(row, column, players[len(moves) % 2])
+                        game_over = board.is_winning_move(row, column, players[len(moves) % 2])
+                        board.undo_move()
+                        if not game_over:
+                            stack.append(moves + [column])
+            for column in moves:
+                board.undo_move()
+
+    from concurrent.futures import ProcessPoolExecutor
+    book_moves = {}
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(search_book_position, geometry, moves, first_piece, time_budget_ms, depth)
+                   for moves, first_piece in positions.values()]
+        for done, future in enumerate(futures, 1):
+            key, column, depth_reached = future.result()
+            book_moves[key] = (column, depth_reached)
+            print(f"\rsearched {done}/{len(futures)} positions", end='', file=sys.stderr)
+    print(file=sys.stderr)
+    return book_moves
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate an opening book by searching early positions deeply.')
+    parser.add_argument('geometry', help='board as columns x rows x number to connect, e.g. 7x6x4')
+    parser.add_argument('--plies', type=int, default=2, help='book every position up to this many moves')
+    parser.add_argument('--time', type=int, default=5000, help='search time per position in milliseconds')
+    parser.add_argument('--depth', type=int, default=None, help='search depth per position instead of time')
+    parser.add_argument('--workers', type=int, default=None, help='processes to search on (default: all cores)')
+    parser.add_argument('--output', help='book file to write (default: books/<geometry>.bin)')
+    args = parser.parse_args()
+    num_of_columns, num_of_rows, num_to_connect = (int(value) for value in args.geometry.lower().split('x'))
+    time_budget_ms = None if args.depth is not None else args.time
+    book_moves = generate_opening_book(num_of_columns, num_of_rows, num_to_connect, args.plies, time_budget_ms,
+                                       args.depth, args.workers)
+    output = args.output or book_path(num_of_columns, num_of_rows, num_to_connect)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    write_opening_book(output, num_of_columns, num_of_rows, num_to_connect, book_moves)
+    print(f"wrote {len(book_moves)} positions to {output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from engine import Board, Player, TranspositionTable, get_geometry
+from tournament import percentile, parse_geometry
+
+# requests and responses are JSON objects, one per line. A request holds a batch of positions:
+#   {"id": 1, "geometry": [7, 6, 4], "time_ms": 200, "positions": [{"moves": [3, 3, 2]}, {"moves": [3], "depth": 6}]}
+# every position can set its own geometry, first_piece (the piece that made the first move, 1 by default), time_ms and
+# depth. The response has a result for every position in the same order, or an error when the request itself can't be
+# read:
+#   {"id": 1, "results": [{"column": 4, "score": 12, "depth": 7, "principal_variation": [4, 2, 4], "nodes": 5120,
+#                          "cached": false}, ...]}
+#   {"id": 1, "error": "..."}
+# a position whose game is already over isn't searched, its result is {"game_over": true, "winner": 1, "cached": false}
+# with winner 0 for a full board. A position that is invalid or can't be analyzed, for example because a move was
+# played after the game was won, gets {"error": "..."} as its result and the other positions are still answered
+MAX_LINE_LENGTH = 1024 * 1024
+MAX_SIDE = 20
+
+
+def analyze_position(geometry, moves, first_piece, time_budget_ms, depth):
+    # runs in a worker process: searches the position the moves lead to for the player to move. Every position gets a
+    # new board, so its table and move ordering don't depend on what the worker searched before and a result only
+    # depends on the position and the budget, which is what the server's cache assumes. The table is sized for the
+    # budget, a megabyte holds more entries than 50 ms of searching stores. Allocating the default 16 MB table takes
+    # longer than a short search of a small board
+    table = TranspositionTable(max(1, min(16, time_budget_ms // 50)))
+    board = Board(*geometry, transposition_table=table)
+    players = [Player('', first_piece, True), Player('', 3 - first_piece, True)]
+    winner = 0
+    for ply, column in enumerate(moves):
+        row = board.heights[column]
+        board.drop_piece(row, column, players[ply % 2])
+        if board.is_winning_move(row, column, players[ply % 2]):
+            winner = players[ply % 2].piece
+    if winner or not board.get_valid_locations():
+        return {'game_over': True, 'winner': winner}
+    side = len(moves) % 2
+    column, score, depth_reached = board.iterative_deepening(players[side], players[1 - side], time_budget_ms,
+                                                             max_depth=depth)
+    principal_variation = board.principal_variation
+    return {'column': column, 'score': score, 'depth': depth_reached, 'principal_variation': principal_variation,
+            'nodes': board.nodes_searched}
+
+
+def is_integer(value):
+    # JSON true and false are ints to Python
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_position(position, request, default_time_ms, max_time_ms):
+    # checks a position of a request and returns its cache key and the arguments of analyze_position. Settings missing
+    # from the position are taken from the request
+    if not isinstance(position, dict):
+        raise ValueError('every position has to be an object')
+    geometry = position.get('geometry', request.get('geometry'))
+    if not isinstance(geometry, list) or len(geometry) != 3 or not all(is_integer(value) for value in geometry):
+        raise ValueError('geometry has to be [columns, rows, number to connect]')
+    num_of_columns, num_of_rows, num_to_connect = geometry
+    if not (1 <= num_of_columns <= MAX_SIDE and 1 <= num_of_rows <= MAX_SIDE
+            and 2 <= num_to_connect <= max(num_of_columns, num_of_rows)):
+        raise ValueError(f"unsupported geometry {geometry}")
+    moves = position.get('moves', [])
+    first_piece = position.get('first_piece', request.get('first_piece', 1))
+    time_ms = position.get('time_ms', request.get('time_ms', default_time_ms))
+    depth = position.get('depth', request.get('depth'))
+    if not is_integer(first_piece) or first_piece not in (1, 2):
+        raise ValueError('first_piece has to be 1 or 2')
+    if not is_integer(time_ms) or time_ms <= 0:
+        raise ValueError('time_ms has to be a positive number of milliseconds')
+    if depth is not None and (not is_integer(depth) or depth <= 0):
+        raise ValueError('depth has to be a positive number')
+    # the pieces of every column from the bottom up, positions with the same columns and player to move are the same
+    # position whatever order the moves were played in. Every move order is checked here, so a result in the cache is
+    # only ever used for move orders that are valid
+    columns = [[] for c in range(num_of_columns)]
+    pieces = (first_piece, 3 - first_piece)
+    if not isinstance(moves, list):
+        raise ValueError('moves has to be a list of columns')
+    board_geometry = get_geometry(num_of_columns, num_of_rows, num_to_connect)
+    bitboards = {1: 0, 2: 0}
+    for ply, column in enumerate(moves):
+        if not is_integer(column) or not 0 <= column < num_of_columns or len(columns[column]) >= num_of_rows:
+            raise ValueError(f"move {ply + 1} ({column}) is not a valid move")
+        if ply and board_geometry.has_connected(bitboards[pieces[(ply - 1) % 2]]):
+            raise ValueError(f"move {ply + 1} ({column}) was played after the game was won")
+        bitboards[pieces[ply % 2]] |= 1 << (column * board_geometry.column_height + len(columns[column]))
+        columns[column].append(pieces[ply % 2])
+    time_ms = min(time_ms, max_time_ms)
+    key = (tuple(geometry), tuple(map(tuple, columns)), pieces[len(moves) % 2], time_ms, depth)
+    return key, (tuple(geometry), tuple(moves), first_piece, time_ms, depth)
+
+
+class AnalysisServer:
+    # searches batches of positions on a pool of worker processes. Results are kept in a cache shared by all
+    # connections, and a position that is already being searched for another request is not searched twice.
+    # Backpressure: at most max_pending searches are queued for the workers and every connection has at most
+    # max_requests_per_connection requests in flight, after that its requests aren't read until one is answered
+    def __init__(self, workers=None, cache_size=100000, max_pending=None, max_requests_per_connection=64,
+                 max_batch=256, default_time_ms=100, max_time_ms=5000):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(self.workers)
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.in_flight = {}  # cache key: asyncio.Future of the search that is running for it
+        self.pending = asyncio.Semaphore(max_pending or 4 * self.workers)
+        self.max_requests_per_connection = max_requests_per_connection
+        self.max_batch = max_batch
+        self.default_time_ms = default_time_ms
+        self.max_time_ms = max_time_ms
+        self.requests_served = 0
+        self.positions_searched = 0
+        self.cache_hits = 0
+
+    async def analyze(self, key, arguments):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.cache_hits += 1
+            return dict(self.cache[key], cached=True)
+        if key in self.in_flight:
+            self.cache_hits += 1
+            return dict(await asyncio.shield(self.in_flight[key]), cached=True)
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        executor = self.executor
+        try:
+            async with self.pending:
+                result = await asyncio.get_running_loop().run_in_executor(executor, analyze_position, *arguments)
+        except Exception as error:
+            if isinstance(error, BrokenProcessPool) and self.executor is executor:
+                # a worker process died and the pool can't be used anymore, later searches get a new one
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = ProcessPoolExecutor(self.workers)
+            future.set_exception(error)
+            future.exception()  # the requests waiting for it get the error, nobody else has to look at it
+            raise
+        finally:
+            del self.in_flight[key]
+        self.positions_searched += 1
+        self.cache[key] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        future.set_result(result)
+        return dict(result, cached=False)
+
+    async def position_error(self, error):
+        # the result of an invalid position, awaited with the searches so the results stay in the positions' order
+        return {'error': str(error)}
+
+    async def handle_request(self, line, writer):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('a request has to be an object')
+            request_id = request.get('id')
+            if not isinstance(request.get('positions'), list):
+                raise ValueError('a request needs a list of positions')
+            if len(request['positions']) > self.max_batch:
+                raise ValueError(f"at most {self.max_batch} positions per request")
+            # every position is answered on its own, an invalid one or a failed search only gives that position an
+            # error result
+            searches = []
+            for position in request['positions']:
+                try:
+                    searches.append(self.analyze(*parse_position(position, request, self.default_time_ms,
+                                                                 self.max_time_ms)))
+                except ValueError as error:
+                    searches.append(self.position_error(error))
+            results = await asyncio.gather(*searches, return_exceptions=True)
+            results = [{'error': f"the analysis failed: {result!r}"} if isinstance(result, Exception) else result
+                       for result in results]
+            response = {'id': request_id, 'results': results}
+        except ValueError as error:
+            response = {'id': request_id, 'error': str(error)}
+        except Exception as error:
+            # every request gets an answer, a client would otherwise wait for it forever
+            response = {'id': request_id, 'error': f"the analysis failed: {error!r}"}
+        self.requests_served += 1
+        writer.write((json.dumps(response) + '\n').encode())
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        requests = asyncio.Semaphore(self.max_requests_per_connection)
+        tasks = set()
+
+        def finished(task):
+            tasks.discard(task)
+            requests.release()
+
+        try:
+            while True:
+                await requests.acquire()
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write((json.dumps({'id': None, 'error': 'request too long'}) + '\n').encode())
+                    break
+                if not line:
+                    break
+                task = asyncio.create_task(self.handle_request(line, writer))
+                tasks.add(task)
+                task.add_done_callback(finished)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, unix_path=None):
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, unix_path, limit=MAX_LINE_LENGTH)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE_LENGTH)
+        # start the worker processes before the first request comes in
+        await asyncio.gather(*(asyncio.get_running_loop().run_in_executor(
+            self.executor, analyze_position, (7, 6, 4), (), 1, 1, 1) for i in range(self.workers)))
+        print(f"listening on {unix_path or f'{host}:{port}'} with {self.workers} workers", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AnalysisClient:
+    # sends requests over one connection without waiting for the answers to earlier ones
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+        self.waiting = {}  # request id: future of its response
+        self.receiver = asyncio.create_task(self.receive())
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=8765, unix_path=None):
+        if unix_path is not None:
+            reader, writer = await asyncio.open_unix_connection(unix_path, limit=MAX_LINE_LENGTH)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE_LENGTH)
+        return cls(reader, writer)
+
+    async def receive(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self.waiting.pop(response['id'], None)
+            if future is not None:
+                future.set_result(response)
+        for future in self.waiting.values():
+            future.set_exception(ConnectionError('the server closed the connection'))
+
+    async def analyze(self, positions, **settings):
+        # positions are dicts like {"moves": [3, 3]}, settings are the request wide geometry, time_ms, depth, ...
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[self.next_id] = future
+        self.writer.write((json.dumps(dict(settings, id=self.next_id, positions=positions)) + '\n').encode())
+        await self.writer.drain()
+        response = await future
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response['results']
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.receiver.cancel()
+
+
+def random_positions(geometry, count, seed):
+    # positions of random games that nobody has won yet, to load test with
+    rng = random.Random(seed)
+    board = Board(*geometry)
+    players = [Player('', 1, True), Player('', 2, True)]
+    positions = []
+    while len(positions) < count:
+        moves = []
+        for ply in range(rng.randrange(0, geometry[0] * geometry[1] // 2)):
+            column = rng.choice(board.get_valid_locations())
+            row = board.heights[column]
+            board.drop_piece(row, column, players[ply % 2])
+            moves.append(column)
+            if board.is_winning_move(row, column, players[ply % 2]):
+                break
+        else:
+            positions.append({'moves': moves})
+        while board.move_history:
+            board.undo_move()
+    return positions
+
+
+async def load_test(host, port, unix_path, requests, concurrency, batch, geometry, distinct, time_ms, depth, seed):
+    # sends requests from concurrency connections at once and reports throughput and latency. Positions are drawn
+    # from a pool of distinct ones, so repeated positions are answered from the cache
+    pool = random_positions(geometry, distinct, seed)
+    rng = random.Random(seed)
+    clients = [await AnalysisClient.connect(host, port, unix_path) for i in range(concurrency)]
+    latencies = []
+    cached = [0, 0]
+    remaining = [requests]
+
+    async def run(client):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            positions = [rng.choice(pool) for i in range(batch)]
+            start = time.perf_counter()
+            results = await client.analyze(positions, geometry=list(geometry), time_ms=time_ms, depth=depth)
+            latencies.append((time.perf_counter() - start) * 1000)
+            for result in results:
+                cached[result.get('cached', False)] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(client) for client in clients))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+    latencies.sort()
+    print(f"{requests} requests of {batch} positions in {elapsed:.2f}s: {requests / elapsed:.0f} requests/s, "
+          f"{requests * batch / elapsed:.0f} positions/s, latency ms p50 {percentile(latencies, 0.5):.1f} "
+          f"p90 {percentile(latencies, 0.9):.1f} p99 {percentile(latencies, 0.99):.1f}, "
+          f"{cached[1] / (cached[0] + cached[1]):.0%} answered from the cache")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyse batches of positions for other programs over a socket.')
+    parser.add_argument('command', choices=('serve', 'load-test'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on / connect to this Unix socket instead of TCP')
+    parser.add_argument('--workers', type=int, default=None, help='search processes (default: all cores)')
+    parser.add_argument('--cache-size', type=int, default=100000, help='results kept in the cache')
+    parser.add_argument('--max-time', type=int, default=5000, help='longest search time a request may ask for in ms')
+    parser.add_argument('--requests', type=int, default=2000, help='load test: number of requests')
+    parser.add_argument('--concurrency', type=int, default=16, help='load test: connections sending at once')
+    parser.add_argument('--batch', type=int, default=1, help='load test: positions per request')
+    parser.add_argument('--geometry', default='7x6x4', help='load test: board as columns x rows x number to connect')
+    parser.add_argument('--distinct', type=int, default=500, help='load test: number of different positions')
+    parser.add_argument('--time', type=int, default=50, help='load test: search time per position in ms')
+    parser.add_argument('--depth', type=int, default=4, help='load test: search depth per position')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        server = AnalysisServer(args.workers, args.cache_size, max_time_ms=args.max_time)
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+    else:
+        asyncio.run(load_test(args.host, args.port, args.unix, args.requests, args.concurrency, args.batch,
+                              parse_geometry(args.geometry), args.distinct, args.time, args.depth, args.seed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,353 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from engine import Board, Player, Solver, BatchEvaluator, MonteCarloSearch, TranspositionTable, WINNING_SCORE
+from game_records import GameRecordWriter, GameRecordReader
+
+RED = Player('Red', 1, True)
+YELLOW = Player('Yellow', 2, True)
+
+
+def random_position(num_of_columns, num_of_rows, num_to_connect, rng, min_moves, max_moves):
+    # a position of a random game that nobody has won yet, with the player to move and the other player
+    while True:
+        board = Board(num_of_columns, num_of_rows, num_to_connect)
+        players = (RED, YELLOW)
+        won = False
+        for ply in range(rng.randint(min_moves, max_moves)):
+            column = rng.choice(board.get_valid_locations())
+            row = board.get_next_open_row(column)
+            board.drop_piece(row, column, players[ply % 2])
+            won = board.is_winning_move(row, column, players[ply % 2])
+            if won or not board.get_valid_locations():
+                break
+        if not won and board.get_valid_locations():
+            side = len(board.move_history) % 2
+            return board, players[side], players[1 - side]
+
+
+def connects_through(grid, row, column, num_to_connect):
+    # brute force: counts the pieces in a line through (row, column) in every direction
+    piece = grid[row][column]
+    for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        count = 1
+        for sign in (1, -1):
+            r, c = row + sign * dr, column + sign * dc
+            while 0 <= r < len(grid) and 0 <= c < len(grid[0]) and grid[r][c] == piece:
+                count += 1
+                r, c = r + sign * dr, c + sign * dc
+        if count >= num_to_connect:
+            return True
+    return False
+
+
+def plain_negamax(board, depth, current_player, opposing_player, search_player):
+    # minimax without a transposition table, move ordering, pruning or threat checks
+    if board.has_connected(board.bitboards[opposing_player.piece]):
+        return -WINNING_SCORE
+    if not board.get_valid_locations():
+        return 0
+    if depth == 0:
+        score = board.score_position(0, 0, search_player, None)
+        return score if current_player is search_player else -score
+    value = -math.inf
+    for column in board.get_valid_locations():
+        board.drop_piece(board.get_next_open_row(column), column, current_player)
+        value = max(value, -plain_negamax(board, depth - 1, opposing_player, current_player, search_player))
+        board.undo_move()
+    return value
+
+
+def brute_force_score(board, current_player, opposing_player, scores):
+    # the exact score the solver uses: a win with the player's next piece being piece number k of the game is worth
+    # (num_of_cells + 1 - (k - 1)) // 2, a draw 0
+    num_of_cells = board.num_of_columns * board.num_of_rows
+    key = (board.bitboards[1], board.bitboards[2])
+    if key not in scores:
+        moves_played = len(board.move_history)
+        value = 0 if moves_played == num_of_cells else -math.inf
+        for column in board.get_valid_locations():
+            row = board.get_next_open_row(column)
+            board.drop_piece(row, column, current_player)
+            if board.is_winning_move(row, column, current_player):
+                value = (num_of_cells + 1 - moves_played) // 2
+            else:
+                value = max(value, -brute_force_score(board, opposing_player, current_player, scores))
+            board.undo_move()
+            if value == (num_of_cells + 1 - moves_played) // 2:
+                break
+        scores[key] = value
+    return scores[key]
+
+
+def plain_playout(board, current_player, opposing_player, rng):
+    # a random game to the end played with Board, returns the winning piece or 0 for a draw
+    players = (current_player, opposing_player)
+    winner = 0
+    moves = 0
+    while board.get_valid_locations():
+        column = rng.choice(board.get_valid_locations())
+        row = board.get_next_open_row(column)
+        board.drop_piece(row, column, players[moves % 2])
+        moves += 1
+        if board.is_winning_move(row, column, players[(moves - 1) % 2]):
+            winner = players[(moves - 1) % 2].piece
+            break
+    for move in range(moves):
+        board.undo_move()
+    return winner
+
+
+def test_is_winning_move_matches_brute_force():
+    rng = random.Random(1)
+    for num_of_columns in range(6, 11):
+        for num_of_rows in range(6, 11):
+            for num_to_connect in range(3, 7):
+                for game in range(3):
+                    board = Board(num_of_columns, num_of_rows, num_to_connect)
+                    grid = [[0] * num_of_columns for r in range(num_of_rows)]
+                    players = (RED, YELLOW)
+                    for ply in range(num_of_columns * num_of_rows):
+                        column = rng.choice(board.get_valid_locations())
+                        row = board.get_next_open_row(column)
+                        board.drop_piece(row, column, players[ply % 2])
+                        grid[row][column] = players[ply % 2].piece
+                        assert board.piece_at(row, column) == players[ply % 2].piece
+                        won = connects_through(grid, row, column, num_to_connect)
+                        assert board.is_winning_move(row, column, players[ply % 2]) == won
+                        if won:
+                            break
+                    assert board.board.tolist() == grid
+
+
+def test_search_matches_plain_negamax():
+    rng = random.Random(2)
+    for geometry in ((5, 4, 4), (6, 5, 4), (7, 6, 4), (6, 6, 3)):
+        for i in range(12):
+            board, current_player, opposing_player = random_position(*geometry, rng, 0, geometry[0] * geometry[1] - 4)
+            threats = board.analyze_threats(current_player, opposing_player)
+            for depth in range(1, 5):
+                # a table holding deeper results of the position would answer with those, so every search gets a
+                # new one
+                board.transposition_table = TranspositionTable()
+                expected = plain_negamax(board, depth, current_player, opposing_player, current_player)
+                column, score = board.minimax(depth, -math.inf, math.inf, True, 0, 0, current_player, opposing_player)
+                assert score == expected, (geometry, board.move_history, depth)
+                if threats.forced_move() is None and not threats.double_threats:
+                    board.transposition_table = TranspositionTable()
+                    column, score, depth_reached = board.iterative_deepening(current_player, opposing_player, None,
+                                                                            max_depth=depth)
+                    assert score == expected, (geometry, board.move_history, depth)
+
+
+def test_minimax_counts_only_its_own_nodes():
+    board = Board(7, 6, 4)
+    counts = []
+    for i in range(3):
+        board.transposition_table = TranspositionTable()
+        board.minimax(4, -math.inf, math.inf, True, 0, 0, RED, YELLOW)
+        assert board.search_stats.nodes == board.nodes_searched
+        assert board.search_stats.depth == 4
+        counts.append(board.nodes_searched)
+    # the killer moves and history scores the first search left make the later ones cheaper, but never add up
+    assert counts[0] >= counts[1] == counts[2]
+
+
+def test_search_keeps_to_forced_and_root_moves_with_a_used_table():
+    # the table of a board that played a game holds results of earlier searches, they must not replace a forced block
+    # or a move outside root_moves
+    rng = random.Random(5)
+    forced_positions = 0
+    players = (RED, YELLOW)
+    for game in range(30):
+        board = Board(6, 6, 4)
+        for ply in range(36):
+            current_player, opposing_player = players[ply % 2], players[1 - ply % 2]
+            forced_move = board.analyze_threats(current_player, opposing_player).forced_move()
+            column, score, depth = board.iterative_deepening(current_player, opposing_player, None, max_depth=3)
+            if forced_move is not None:
+                forced_positions += 1
+                assert column == forced_move, board.move_history
+            root_move = rng.choice(board.get_valid_locations())
+            column, score, depth = board.iterative_deepening(current_player, opposing_player, None, max_depth=3,
+                                                             root_moves=[root_move])
+            assert column == root_move, board.move_history
+            column = rng.choice(board.get_valid_locations())
+            row = board.get_next_open_row(column)
+            board.drop_piece(row, column, current_player)
+            if board.is_winning_move(row, column, current_player) or not board.get_valid_locations():
+                break
+    assert forced_positions > 50
+    # nor may the value of a search limited to root_moves be used for its position by a later search that reaches it
+    # through another move: every position two moves ahead is searched limited to one of its moves first, then the
+    # position two moves deeper than that and it has to get the score of the plain minimax
+    positions = [[4, 0, 4, 1, 0, 0, 3], [5, 5, 4, 0, 4]]
+    positions += [random_position(6, 6, 4, rng, 2, 16)[0].move_history for i in range(6)]
+    for moves in positions:
+        board = Board(6, 6, 4)
+        for ply, column in enumerate(moves):
+            board.drop_piece(board.get_next_open_row(column), column, players[ply % 2])
+        current_player, opposing_player = players[len(moves) % 2], players[1 - len(moves) % 2]
+        for first in board.get_valid_locations():
+            row = board.get_next_open_row(first)
+            board.drop_piece(row, first, current_player)
+            if not board.is_winning_move(row, first, current_player):
+                for second in board.get_valid_locations():
+                    row = board.get_next_open_row(second)
+                    board.drop_piece(row, second, opposing_player)
+                    if not board.is_winning_move(row, second, opposing_player) and board.get_valid_locations():
+                        board.iterative_deepening(current_player, opposing_player, None, max_depth=3,
+                                                  root_moves=[rng.choice(board.get_valid_locations())])
+                    board.undo_move()
+            board.undo_move()
+        expected = plain_negamax(board, 5, current_player, opposing_player, current_player)
+        column, score = board.minimax(5, -math.inf, math.inf, True, 0, 0, current_player, opposing_player)
+        assert score == expected, moves
+
+
+def test_solver_matches_brute_force():
+    rng = random.Random(3)
+    # the brute force search takes seconds from the empty 4x4 board, on 5x4 the positions start a few moves in
+    for geometry, min_moves, max_moves, positions in (((4, 4, 4), 0, 0, 1), ((4, 4, 3), 0, 6, 10),
+                                                      ((5, 4, 4), 6, 12, 10), ((5, 4, 3), 2, 8, 10)):
+        solver = Solver(*geometry)
+        for i in range(positions):
+            board, current_player, opposing_player = random_position(*geometry, rng, min_moves, max_moves)
+            expected = brute_force_score(board, current_player, opposing_player, {})
+            assert solver.solve(board, current_player) == expected, (geometry, board.move_history)
+            weak = solver.solve(board, current_player, weak=True)
+            assert (weak > 0) - (weak < 0) == (expected > 0) - (expected < 0), (geometry, board.move_history)
+            column, score = solver.best_move(board, current_player)
+            assert score == expected, (geometry, board.move_history)
+
+
+def test_batch_evaluator_matches_board():
+    rng = random.Random(4)
+    for geometry in ((6, 6, 4), (7, 6, 4), (8, 7, 5), (10, 10, 3)):
+        boards, positions = [], []
+        for game in range(20):
+            board = Board(*geometry)
+            players = (RED, YELLOW)
+            for ply in range(rng.randint(0, geometry[0] * geometry[1])):
+                column = rng.choice(board.get_valid_locations())
+                row = board.get_next_open_row(column)
+                board.drop_piece(row, column, players[ply % 2])
+                if board.is_winning_move(row, column, players[ply % 2]) or not board.get_valid_locations():
+                    break
+            boards.append(board.board)
+            positions.append(board)
+        evaluator = BatchEvaluator(*geometry, chunk_size=7)
+        for player in (RED, YELLOW):
+            scores, winners, draws = evaluator.evaluate(np.array(boards), player.piece)
+            for index, board in enumerate(positions):
+                winner = next((piece for piece in (1, 2) if board.has_connected(board.bitboards[piece])), 0)
+                assert scores[index] == board.score_position(0, 0, player, None)
+                assert winners[index] == winner
+                assert draws[index] == (winner == 0 and not board.get_valid_locations())
+
+
+def test_game_records_replay_to_the_same_positions(tmp_path):
+    rng = random.Random(6)
+    path = tmp_path / 'games.rec'
+    for geometry in ((7, 6, 4), (10, 10, 5), (6, 9, 3)):
+        games = []
+        with GameRecordWriter(path, *geometry) as writer:
+            for game in range(40):
+                first_piece = rng.choice((1, 2))
+                players = (Player('', first_piece, True), Player('', 3 - first_piece, True))
+                board = Board(*geometry)
+                winner = 0
+                for ply in range(rng.randint(0, geometry[0] * geometry[1])):
+                    column = rng.choice(board.get_valid_locations())
+                    row = board.get_next_open_row(column)
+                    board.drop_piece(row, column, players[ply % 2])
+                    if board.is_winning_move(row, column, players[ply % 2]):
+                        winner = players[ply % 2].piece
+                    if winner or not board.get_valid_locations():
+                        break
+                writer.write(board.move_history, first_piece, winner)
+                games.append((board, first_piece, winner))
+        reader = GameRecordReader(path)
+        assert (reader.num_of_columns, reader.num_of_rows, reader.num_to_connect) == geometry
+        records = 0
+        for record, (board, first_piece, winner) in zip(reader, games):
+            assert (list(record.moves), record.first_piece, record.winner) == (board.move_history, first_piece, winner)
+            replayed = reader.replay(record)
+            assert replayed.bitboards == board.bitboards
+            assert replayed.heights == board.heights
+            assert (replayed.hash, replayed.mirror_hash) == (board.hash, board.mirror_hash)
+            assert (replayed.board == board.board).all()
+            records += 1
+        assert records == len(games)
+    # a file cut off inside a game, in its moves or in its record header, can't be read to the end
+    data = path.read_bytes()
+    last_record_size = 4 + len(games[-1][0].move_history)
+    for cut in (1, last_record_size - 1, last_record_size - 3):
+        path.write_bytes(data[:-cut])
+        with pytest.raises(ValueError):
+            for record in GameRecordReader(path):
+                pass
+    path.write_bytes(data[:3])
+    with pytest.raises(ValueError):
+        GameRecordReader(path)
+
+
+def test_playouts_match_plain_random_games():
+    # the playouts of a position end in wins and draws as often as random games played with Board
+    rng = random.Random(7)
+    games = 2000
+    for geometry in ((7, 6, 4), (10, 10, 6), (6, 6, 3), (8, 7, 5)):
+        search = MonteCarloSearch(*geometry, seed=7)
+        positions = [(Board(*geometry), RED, YELLOW), random_position(*geometry, rng, 4, 12)]
+        for board, current_player, opposing_player in positions:
+            winners = search.playout(board.board.reshape(1, -1), np.array([board.heights]),
+                                     np.array([current_player.piece]), games)
+            expected = [plain_playout(board, current_player, opposing_player, rng) for i in range(games)]
+            for piece in (0, 1, 2):
+                share = np.count_nonzero(winners == piece) / games
+                expected_share = expected.count(piece) / games
+                # 4.5 standard deviations of the difference of the two shares
+                tolerance = 4.5 * math.sqrt(2 * max(expected_share * (1 - expected_share), 0.01) / games)
+                assert abs(share - expected_share) <= tolerance, (geometry, board.move_history, piece)
+
+
+def test_monte_carlo_search_keeps_its_tree_between_moves():
+    search = MonteCarloSearch(7, 6, 4, seed=1)
+    board = Board(7, 6, 4)
+    column, win_rate, simulations = search.search(board, RED, YELLOW, max_simulations=4096)
+    reply = max(next(child for child in search.root.children if child.move == column).children,
+                key=lambda child: child.visits)
+    visits = reply.visits
+    board.drop_piece(board.get_next_open_row(column), column, RED)
+    board.drop_piece(board.get_next_open_row(reply.move), reply.move, YELLOW)
+    column, win_rate, simulations = search.search(board, RED, YELLOW, max_simulations=1024)
+    # the position after the two moves is the node the last search already grew, with its visits kept
+    assert search.root is reply and reply.parent is None
+    assert reply.visits == visits + simulations
+    assert sum(child.visits for child in reply.children) <= reply.visits
+    # a position of another game gets a new tree
+    other = Board(7, 6, 4)
+    other.drop_piece(0, 0, RED)
+    other.drop_piece(0, 6, YELLOW)
+    column, win_rate, simulations = search.search(other, RED, YELLOW, max_simulations=1024)
+    assert search.root is not reply and search.root.visits == simulations
+
+
+def test_seeded_monte_carlo_search_repeats():
+    board = Board(7, 6, 4)
+    for ply, column in enumerate((3, 3, 2)):
+        board.drop_piece(board.get_next_open_row(column), column, (RED, YELLOW)[ply % 2])
+    results = {}
+    for workers in (1, 2):
+        for i in range(2):
+            search = MonteCarloSearch(7, 6, 4, workers=workers, seed=3)
+            results.setdefault(workers, []).append(search.search(board, YELLOW, RED, max_simulations=4096))
+            search.close()
+        assert results[workers][0] == results[workers][1], workers
+        assert results[workers][0][2] >= 4096
+    # another seed plays other games
+    search = MonteCarloSearch(7, 6, 4, seed=4)
+    assert search.search(board, YELLOW, RED, max_simulations=4096)[1] != results[1][0][1]
@@ -0,0 +1,253 @@
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from engine import Board, Player, Solver, MonteCarloSearch, TranspositionTable
+from opening_book import get_opening_book
+from game_records import GameRecordWriter
+
+
+class MinimaxEngine:
+    # iterative deepening search limited by depth, time and/or nodes, optionally playing opening book moves first
+    def __init__(self, board, depth=None, time_budget_ms=None, node_budget=None, use_opening_book=False):
+        self.board = board
+        self.depth = depth
+        self.time_budget_ms = time_budget_ms
+        self.node_budget = node_budget
+        if depth is None and time_budget_ms is None and node_budget is None:
+            self.time_budget_ms = 1000
+        self.opening_book = None
+        if use_opening_book:
+            self.opening_book = get_opening_book(board.num_of_columns, board.num_of_rows, board.num_to_connect)
+
+    def choose_move(self, current_player, opposing_player, rng):
+        if self.opening_book is not None:
+            column = self.opening_book.lookup(self.board, current_player)
+            if column is not None and self.board.is_valid_move(column):
+                return column
+        column, score, depth = self.board.iterative_deepening(current_player, opposing_player, self.time_budget_ms,
+                                                              self.node_budget, self.depth)
+        return column
+
+
+class SolverEngine:
+    # perfect play, only practical on small boards
+    def __init__(self, board, solver):
+        self.board = board
+        self.solver = solver
+
+    def choose_move(self, current_player, opposing_player, rng):
+        column, score = self.solver.best_move(self.board, current_player)
+        return column
+
+
+class MonteCarloEngine:
+    # Monte Carlo tree search for a time budget or a number of simulations, keeping its tree between moves
+    def __init__(self, board, search, time_budget_ms=None, max_simulations=None):
+        self.board = board
+        self.search = search
+        self.time_budget_ms = time_budget_ms if time_budget_ms is not None else 1000
+        self.max_simulations = max_simulations
+
+    def choose_move(self, current_player, opposing_player, rng):
+        column, win_rate, simulations = self.search.search(self.board, current_player, opposing_player,
+                                                           self.time_budget_ms, self.max_simulations)
+        return column
+
+
+class RandomEngine:
+    def __init__(self, board):
+        self.board = board
+
+    def choose_move(self, current_player, opposing_player, rng):
+        return rng.choice(self.board.get_valid_locations())
+
+
+def parse_engine(spec):
+    # engine specs look like "minimax:depth=4", "minimax:time=200,nodes=50000", "solver:table=512", "mcts:sims=20000"
+    # or "random"
+    kind, _, options = spec.partition(':')
+    settings = {}
+    for option in filter(None, options.split(',')):
+        key, _, value = option.partition('=')
+        settings[key] = int(value)
+    if kind not in ('minimax', 'solver', 'mcts', 'random'):
+        raise ValueError(f"unknown engine '{kind}' in '{spec}'")
+    unknown = set(settings) - {'depth', 'time', 'nodes', 'table', 'book', 'sims'}
+    if unknown:
+        raise ValueError(f"unknown option(s) {', '.join(sorted(unknown))} in '{spec}'")
+    return kind, settings
+
+
+def create_engine(spec, num_of_columns, num_of_rows, num_to_connect):
+    kind, settings = parse_engine(spec)
+    # every engine gets its own board and transposition table so the two sides don't share work
+    board = Board(num_of_columns, num_of_rows, num_to_connect, TranspositionTable(settings.get('table', 16)))
+    if kind == 'random':
+        return RandomEngine(board)
+    if kind == 'solver':
+        solver = Solver(num_of_columns, num_of_rows, num_to_connect, TranspositionTable(settings.get('table', 256)))
+        return SolverEngine(board, solver)
+    if kind == 'mcts':
+        return MonteCarloEngine(board, MonteCarloSearch(num_of_columns, num_of_rows, num_to_connect),
+                                settings.get('time'), settings.get('sims'))
+    return MinimaxEngine(board, settings.get('depth'), settings.get('time'), settings.get('nodes'),
+                         bool(settings.get('book', 0)))
+
+
+def parse_geometry(text):
+    # geometries are written as columns x rows x number to connect, e.g. 7x6x4
+    num_of_columns, num_of_rows, num_to_connect = (int(value) for value in text.lower().split('x'))
+    return num_of_columns, num_of_rows, num_to_connect
+
+
+def play_game(engine_specs, geometry, first, seed, random_opening):
+    # plays one game without a display, engine_specs[first] moves first. The first random_opening moves are random
+    # so that games between deterministic engines don't all repeat each other
+    num_of_columns, num_of_rows, num_to_connect = geometry
+    rng = random.Random(seed)
+    engines = [create_engine(spec, num_of_columns, num_of_rows, num_to_connect) for spec in engine_specs]
+    board = engines[0].board
+    players = [Player('Red', 1, True), Player('Yellow', 2, True)]
+    seats = [first, 1 - first]  # engine index playing piece 1 and piece 2
+    moves = []
+    latencies = [[], []]
+    winner = None
+    turn = 0
+    while board.get_valid_locations():
+        engine_index = seats[turn]
+        current_player, opposing_player = players[turn], players[1 - turn]
+        start = time.perf_counter()
+        if len(moves) < random_opening:
+            column = rng.choice(board.get_valid_locations())
+        else:
+            column = engines[engine_index].choose_move(current_player, opposing_player, rng)
+            latencies[engine_index].append((time.perf_counter() - start) * 1000)
+        row = board.get_next_open_row(column)
+        for engine in engines:
+            if engine.board is not board:
+                engine.board.drop_piece(row, column, current_player)
+        board.drop_piece(row, column, current_player)
+        moves.append(column)
+        if board.is_winning_move(row, column, current_player):
+            winner = engine_index
+            break
+        turn = 1 - turn
+    return {'engines': list(engine_specs), 'geometry': list(geometry), 'first': first, 'seed': seed,
+            'winner': winner, 'moves': moves, 'latencies_ms': latencies}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def elo_difference(score_fraction):
+    # rating difference that the logistic Elo model expects for a score fraction
+    if score_fraction <= 0:
+        return -math.inf
+    if score_fraction >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score_fraction - 1)
+
+
+def summarize(results, engine_specs):
+    lines = []
+    for a, b in itertools.combinations(range(len(engine_specs)), 2):
+        pair = [result for result in results if result['engines'] == [engine_specs[a], engine_specs[b]]]
+        wins = sum(1 for result in pair if result['winner'] == 0)
+        losses = sum(1 for result in pair if result['winner'] == 1)
+        draws = len(pair) - wins - losses
+        if not pair:
+            continue
+        score = (wins + draws / 2) / len(pair)
+        lines.append(f"{engine_specs[a]} vs {engine_specs[b]}: {len(pair)} games, "
+                     f"win {wins / len(pair):.1%} draw {draws / len(pair):.1%} loss {losses / len(pair):.1%}, "
+                     f"Elo difference {elo_difference(score):+.0f}")
+    for index, spec in enumerate(engine_specs):
+        latencies = []
+        for result in results:
+            for seat, engine in enumerate(result['engines']):
+                if engine == spec:
+                    latencies.extend(result['latencies_ms'][seat])
+        latencies.sort()
+        lines.append(f"{spec} move latency ms: p50 {percentile(latencies, 0.5):.1f} "
+                     f"p90 {percentile(latencies, 0.9):.1f} p99 {percentile(latencies, 0.99):.1f} "
+                     f"max {latencies[-1] if latencies else float('nan'):.1f} ({len(latencies)} moves)")
+    return '\n'.join(lines)
+
+
+def run_tournament(engine_specs, geometries, games, workers=None, output=None, seed=0, random_opening=2,
+                   records=None):
+    # every pair of engines plays the given number of games on every geometry, taking turns to move first. Results
+    # are written to the output file as JSON lines as soon as each game finishes, and the moves of every game to the
+    # records file, which only holds games of one geometry
+    jobs = []
+    for geometry in geometries:
+        for a, b in itertools.combinations(range(len(engine_specs)), 2):
+            for game in range(games):
+                jobs.append(([engine_specs[a], engine_specs[b]], geometry, game % 2, seed + len(jobs)))
+    results = []
+    output_file = open(output, 'w') if output else None
+    record_writer = GameRecordWriter(records, *geometries[0]) if records else None
+    try:
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(play_game, specs, geometry, first, game_seed, random_opening)
+                       for specs, geometry, first, game_seed in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if output_file is not None:
+                    output_file.write(json.dumps(result) + '\n')
+                    output_file.flush()
+                if record_writer is not None:
+                    # piece 1 always moves first, played by the engine in seat 'first'
+                    winning_piece = 0 if result['winner'] is None else 1 if result['winner'] == result['first'] else 2
+                    record_writer.write(result['moves'], 1, winning_piece)
+    finally:
+        if output_file is not None:
+            output_file.close()
+        if record_writer is not None:
+            record_writer.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play computer players against each other without a window.')
+    parser.add_argument('engines', nargs='+',
+                        help='engines to compare, e.g. minimax:depth=4, minimax:time=200,book=1, solver, '
+                             'mcts:time=200 or random')
+    parser.add_argument('--geometry', action='append',
+                        help='board as columns x rows x number to connect, can be repeated (default 7x6x4)')
+    parser.add_argument('--games', type=int, default=100, help='games per pair of engines and geometry')
+    parser.add_argument('--workers', type=int, default=None, help='processes to play on (default: all cores)')
+    parser.add_argument('--output', help='JSON lines file that every finished game is written to')
+    parser.add_argument('--records', help='game record file that the moves of every game are written to')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--random-opening', type=int, default=2,
+                        help='number of random moves at the start of every game')
+    args = parser.parse_args()
+    if len(args.engines) < 2:
+        parser.error('at least two engines are needed')
+    try:
+        for spec in args.engines:
+            parse_engine(spec)
+        geometries = [parse_geometry(text) for text in (args.geometry or ['7x6x4'])]
+    except ValueError as error:
+        parser.error(str(error))
+    if args.records and len(geometries) > 1:
+        parser.error('a records file only holds games of one geometry')
+
+    results = run_tournament(args.engines, geometries, args.games, args.workers, args.output, args.seed,
+                             args.random_opening, args.records)
+    print(summarize(results, args.engines))
+
+
+if __name__ == "__main__":
+    sys.exit(main())